@@ -10,7 +10,21 @@ __status__ = 'prod'
 
 import sys
 import argparse
-import subprocess
+import os
+import shutil
+import tempfile
+import heapq
+import hashlib
+from itertools import groupby
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'orthodb_utils'))
+from level2species import species_at_level
+from og_store import export_og_store
+from compressed_io import open_compressed, is_compressed
+from og_index import is_og_index, og_names
+from contextlib import ExitStack
 
 
 ##################################################################################################################################################
@@ -19,7 +33,19 @@ import subprocess
 #
 ##################################################################################################################################################
 
-def extract_line_bacteria(OrthoDB_file, bacteria_line_file, species_file):
+def load_bacteria_identifiers(species_file, level=2):
+    '''
+    Returns the set of OrthoDB species identifiers (e.g. 1000588_0) having the
+    taxonomic level (2 = Bacteria by default, 2157 = Archaea, ...) in their
+    taxonomy according to species_file (odb11v0_level2species.tab).
+    '''
+    identifiants = species_at_level(species_file, level)
+    if not identifiants:
+        raise ValueError(f"the taxonomic level {level} is not found in {species_file}")
+    return identifiants
+
+
+def extract_line_bacteria(OrthoDB_file, bacteria_line_file, species_file, level=2):
     '''
     Extracts lines from the OrthoDB_file that match the identifiers
     specified in the bacteria_IDs_file and writes them to the
@@ -31,19 +57,17 @@ def extract_line_bacteria(OrthoDB_file, bacteria_line_file, species_file):
         bacteria_line_file (str): Path to the output file where matching
             lines will be written.
         species_file (str): Path to the file containing bacterial species identifiers.
+        level (int): taxonomic level of the species to keep (default: 2, Bacteria).
 
     This function reads the identifiers from species_file and
     scans each line in OrthoDB_file. If an identifier in OrthoDB_file
     matches any of the identifiers in species_file, the line is
     written to the bacteria_line_file.
     '''
-    command = f"awk '$1==2' {species_file} | cut -f2"
-    result = subprocess.check_output(command, shell=True, text=True)
+    identifiants = load_bacteria_identifiers(species_file, level)
 
-    identifiants = set(result.strip().split('\n'))
-
-    with open(bacteria_line_file, 'w') as blf:
-        with open(OrthoDB_file, 'r') as of:
+    with open_compressed(bacteria_line_file, 'w') as blf:
+        with open_compressed(OrthoDB_file, 'r') as of:
             for line in of:
                 parts = line.split()
                 if len(parts) >= 2:
@@ -70,34 +94,41 @@ def extract_unique_og_ids(bacteria_line_file, uniq_OG):
     identifiers to the uniq_OG file.
     '''
     uniq_ids = set()
-    with open(bacteria_line_file, 'r') as file:
+    with open_compressed(bacteria_line_file, 'r') as file:
         for line in file:
             parts = line.strip().split('\t') 
             if len(parts) >= 1:
                 identifier = parts[0]
                 uniq_ids.add(identifier)
-    with open(uniq_OG, 'w') as ug:
+    with open_compressed(uniq_OG, 'w') as ug:
         for identifier in uniq_ids:
             ug.write(identifier + '\n')
             
     print("Finished. the unique OG identifiers are written here ",uniq_OG)
 
-def load_gene_names(OGs_tab_file):
+def load_gene_names(OGs_tab_file, OG_ids=None):
     """
     Loads gene names from the provided OGs_tab_file into a dictionary.
 
     Parameters:
-        OGs_tab_file (str): Path to the file containing OG IDs and gene names.
+        OGs_tab_file (str): Path to the file containing OG IDs and gene names,
+            or to an OrthoDB index built by orthodb_utils/og_index.py.
+        OG_ids (set, optional): if given, only the names of these OGs are loaded.
 
     Returns:
         dict: A dictionary mapping OG IDs to gene names.
     """
+    if is_og_index(OGs_tab_file):
+        return og_names(OGs_tab_file, OG_ids)
+
     gene_names = {}
-    with open(OGs_tab_file, 'r') as f:
+    with open_compressed(OGs_tab_file, 'r') as f:
         for line in f:
             fields = line.strip().split('\t')
             if len(fields) >= 3:
                 OG_id = fields[0]
+                if OG_ids is not None and OG_id not in OG_ids:
+                    continue
                 gene_name = fields[2]
                 gene_names[OG_id] = gene_name
     return gene_names
@@ -120,12 +151,12 @@ def file_creation(uniq_OG, OrthoDB_file, final_output, OGs_tab_file):
     # Load gene names from the OGs_tab_file
     gene_names = load_gene_names(OGs_tab_file)
 
-    with open(uniq_OG, "r") as f:
+    with open_compressed(uniq_OG, "r") as f:
         ids = [line.strip() for line in f]
 
     id_to_values = {}
 
-    with open(OrthoDB_file, "r") as f:
+    with open_compressed(OrthoDB_file, "r") as f:
         for line in f:
             fields = line.strip().split("\t")
             if len(fields) == 2:
@@ -136,19 +167,422 @@ def file_creation(uniq_OG, OrthoDB_file, final_output, OGs_tab_file):
                 else:
                     id_to_values[id_value] = [value]
 
-    with open(final_output, "w") as fo:
+    with open_compressed(final_output, "w") as fo:
         fo.write("OG_id\tgene_id\tspecies_id\tgene_name\n")
         for id in ids:
             values = id_to_values.get(id, [])
             if values:
-                values_col2 = ';'.join(values)
-                values_col3 = ';'.join(value.split(':')[0].split('_')[0] for value in values)
-                gene_name = gene_names.get(id, "")
-                fo.write(f"{id}\t{values_col2}\t{values_col3}\t{gene_name}\n")
+                fo.write(format_og_line(id, values, gene_names))
             else:
                 fo.write(f"{id}\t\t\t\n")
     print("Finished. The final file containing one line per bacterial OG is here :",final_output)
 
+def write_sorted_run(buffer, tmp_dir, run_files):
+    '''
+    Sorts buffer, a list of (OG rank, line number, gene_id), and writes it
+    to a new run file of tmp_dir, whose path is appended to run_files.
+    '''
+    buffer.sort()
+    run_path = os.path.join(tmp_dir, f"run_{len(run_files)}.tab")
+    with open(run_path, "w") as run_file:
+        run_file.writelines(f"{rank}\t{line_number}\t{value}\n" for rank, line_number, value in buffer)
+    run_files.append(run_path)
+
+def read_sorted_run(run_path):
+    '''
+    Yields the (OG rank, line number, gene_id) of a run file written by write_sorted_run.
+    '''
+    with open(run_path, "r") as run_file:
+        for line in run_file:
+            rank, line_number, value = line.rstrip("\n").split("\t")
+            yield int(rank), int(line_number), value
+
+def external_file_creation(uniq_OG, OrthoDB_file, final_output, OGs_tab_file, memory_budget):
+    '''
+    Memory-bounded version of file_creation, writing the same final output.
+
+    Instead of holding every gene of OrthoDB in a dictionary, the genes of the
+    OGs listed in uniq_OG are buffered until their estimated size reaches
+    memory_budget, then sorted by (position of the OG in uniq_OG, line number)
+    and spilled to a run file. The run files are finally merged, so the genes
+    are written OG by OG, in the order of uniq_OG and of OrthoDB_file.
+
+    Parameters:
+        uniq_OG (str): Path to a file containing unique OG identifiers.
+        OrthoDB_file (str): Path to the OrthoDB file.
+        final_output (str): Path to the final output file.
+        OGs_tab_file (str): Path to the file containing OG IDs and gene names.
+        memory_budget (int): approximate memory, in MB, used to buffer the genes.
+    '''
+    with open_compressed(uniq_OG, "r") as f:
+        ids = [line.strip() for line in f]
+    ranks = {id: rank for rank, id in enumerate(ids)}
+    gene_names = load_gene_names(OGs_tab_file, ranks)
+
+    # Rough size of one buffered gene: tuple, two ints and a short string
+    entry_size = 200
+    max_entries = max(1, memory_budget * 1024 * 1024 // entry_size)
+
+    tmp_dir = tempfile.mkdtemp(prefix="tmp_bacterial_OG_", dir=os.path.dirname(os.path.abspath(final_output)))
+    try:
+        run_files = []
+        buffer = []
+        with open_compressed(OrthoDB_file, "r") as f:
+            for line_number, line in enumerate(f):
+                fields = line.strip().split("\t")
+                if len(fields) == 2 and fields[0] in ranks:
+                    buffer.append((ranks[fields[0]], line_number, fields[1]))
+                    if len(buffer) >= max_entries:
+                        write_sorted_run(buffer, tmp_dir, run_files)
+                        buffer = []
+        buffer.sort()
+
+        merged = heapq.merge(buffer, *(read_sorted_run(run_path) for run_path in run_files))
+        with open_compressed(final_output, "w") as fo:
+            fo.write("OG_id\tgene_id\tspecies_id\tgene_name\n")
+            next_rank = 0
+            for rank, group in groupby(merged, key=itemgetter(0)):
+                for missing_rank in range(next_rank, rank):
+                    fo.write(f"{ids[missing_rank]}\t\t\t\n")
+                fo.write(format_og_line(ids[rank], [value for _, _, value in group], gene_names))
+                next_rank = rank + 1
+            for missing_rank in range(next_rank, len(ids)):
+                fo.write(f"{ids[missing_rank]}\t\t\t\n")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print("Finished. The final file containing one line per bacterial OG is here :",final_output)
+
+def format_og_line(OG_id, values, gene_names):
+    '''
+    Formats one line of the final output: OG_id, gene_ids and species_ids
+    (both ';'-joined) and gene_name.
+
+    Parameters:
+        OG_id (str): OG identifier.
+        values (list): gene identifiers of the OG (e.g. 1000588_0:000589).
+        gene_names (dict): OG IDs to gene names, as returned by load_gene_names.
+    '''
+    values_col2 = ';'.join(values)
+    values_col3 = ';'.join(value.split(':')[0].split('_')[0] for value in values)
+    gene_name = gene_names.get(OG_id, "")
+    return f"{OG_id}\t{values_col2}\t{values_col3}\t{gene_name}\n"
+
+def iter_og_groups(lines, seen_ids=None, OrthoDB_file=None):
+    '''
+    Yields (OG_id, gene_ids) for each block of consecutive lines sharing the
+    same OG_id.
+
+    Parameters:
+        lines (iterable): lines of odb11v0_OG2genes.tab (an open file or a
+            byte range of it, see read_byte_range).
+        seen_ids (set, optional): if given, every OG_id of lines, bacterial or
+            not, is checked and added to it (see check_og_not_split), so an OG
+            whose lines are not contiguous raises a ValueError instead of
+            losing the genes of one of its blocks.
+        OrthoDB_file (str, optional): name of the file in the error message.
+
+    OrthoDB writes all the genes of an OG as one contiguous block in
+    odb11v0_OG2genes.tab, so only one OG is held in memory at a time.
+    '''
+    current_id = None
+    values = []
+    for line in lines:
+        fields = line.strip().split("\t")
+        if len(fields) != 2:
+            continue
+        if fields[0] != current_id:
+            if values:
+                yield current_id, values
+            current_id = fields[0]
+            values = []
+            if seen_ids is not None:
+                check_og_not_split(current_id, seen_ids, OrthoDB_file)
+        values.append(fields[1])
+    if values:
+        yield current_id, values
+
+def iter_bacterial_og_groups(lines, identifiants, seen_ids=None, OrthoDB_file=None):
+    '''
+    Yields (OG_id, gene_ids, bacterial_gene_ids) for each OG of lines that
+    contains at least one gene of a species in identifiants. seen_ids and
+    OrthoDB_file: see iter_og_groups.
+    '''
+    for OG_id, values in iter_og_groups(lines, seen_ids, OrthoDB_file):
+        bacterial_values = [value for value in values if value.split(':')[0] in identifiants]
+        if bacterial_values:
+            yield OG_id, values, bacterial_values
+
+def streaming_file_creation(OrthoDB_file, species_file, final_output, OGs_tab_file, bacteria_line_file=None, uniq_OG=None, level=2):
+    '''
+    Single-pass equivalent of extract_line_bacteria, extract_unique_og_ids and
+    file_creation: odb11v0_OG2genes.tab is read once, grouped by OG_id on the
+    fly, and every OG containing at least one bacterial gene is written
+    directly to final_output.
+
+    Parameters:
+        OrthoDB_file (str): Path to the OrthoDB file (odb11v0_OG2genes.tab).
+        species_file (str): Path to the file containing bacterial species identifiers.
+        final_output (str): Path to the final output file.
+        OGs_tab_file (str): Path to the file containing OG IDs and gene names.
+        bacteria_line_file (str, optional): if given, the bacterial lines of
+            OrthoDB_file are also written there.
+        uniq_OG (str, optional): if given, the bacterial OG identifiers are also
+            written there.
+        level (int): taxonomic level of the species to keep (default: 2, Bacteria).
+
+    Memory is bounded by the largest OG plus the set of the OG identifiers of
+    OrthoDB_file, which is used to check that no OG is split over several blocks.
+    '''
+    identifiants = load_bacteria_identifiers(species_file, level)
+    gene_names = load_gene_names(OGs_tab_file)
+    seen_ids = set()
+
+    with ExitStack() as stack:
+        fo = stack.enter_context(open_compressed(final_output, "w"))
+        blf = stack.enter_context(open_compressed(bacteria_line_file, "w")) if bacteria_line_file else None
+        ug = stack.enter_context(open_compressed(uniq_OG, "w")) if uniq_OG else None
+        of = stack.enter_context(open_compressed(OrthoDB_file, "r"))
+
+        fo.write("OG_id\tgene_id\tspecies_id\tgene_name\n")
+        for OG_id, values, bacterial_values in iter_bacterial_og_groups(of, identifiants, seen_ids, OrthoDB_file):
+            fo.write(format_og_line(OG_id, values, gene_names))
+            if blf:
+                blf.writelines(f"{OG_id}\t{value}\n" for value in bacterial_values)
+            if ug:
+                ug.write(OG_id + '\n')
+
+    print("Finished. The final file containing one line per bacterial OG is here :",final_output)
+
+def check_og_not_split(OG_id, seen_ids, OrthoDB_file):
+    '''
+    Raises a ValueError if OG_id has already been seen, i.e. if its lines
+    are not contiguous in OrthoDB_file. Otherwise adds it to seen_ids.
+    '''
+    if OG_id in seen_ids:
+        raise ValueError(f"the lines of {OG_id} are not contiguous in {OrthoDB_file}. "
+                         "Sort the file by OG_id or run without --streaming.")
+    seen_ids.add(OG_id)
+
+##################################################################################################################################################
+#
+# INCREMENTAL UPDATE
+#
+##################################################################################################################################################
+
+def membership_hash(values, gene_name=""):
+    '''
+    Returns the content hash of an OG: a digest of its sorted gene ids and of
+    its gene name, so it changes when genes enter or leave the OG or when the
+    OG is renamed, i.e. whenever its line of the final output changes.
+    '''
+    return hashlib.blake2b(('\n'.join(sorted(values)) + '\t' + gene_name).encode(), digest_size=16).hexdigest()
+
+def load_previous_og_table(previous_output):
+    '''
+    Indexes the final output of a previous OrthoDB release. Only the hash of
+    each OG is kept, so the memory does not grow with the size of the genes.
+
+    Returns:
+        dict: OG_id -> membership hash, in the order of previous_output.
+    '''
+    previous = {}
+    with open_compressed(previous_output, "r") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] == "OG_id" or len(fields) < 2:
+                continue
+            values = fields[1].split(';') if fields[1] else []
+            gene_name = fields[3] if len(fields) > 3 else ""
+            previous[fields[0]] = membership_hash(values, gene_name)
+    return previous
+
+def incremental_file_creation(previous_output, OrthoDB_file, species_file, final_output, OGs_tab_file, manifest, level=2):
+    '''
+    Updates the final output of a previous release with a new OrthoDB release.
+
+    The new odb11v0_OG2genes.tab is streamed and written as in
+    streaming_file_creation, so the output is the one of a full rebuild, and
+    the membership hash of each bacterial OG (genes and gene name) is compared
+    to the one of the previous final output to tell which OGs are new,
+    changed or unchanged.
+
+    Parameters:
+        previous_output (str): final output built from the previous release.
+        manifest (str): OUTPUT: tab-delimited file OG_id, status (added, changed,
+            unchanged or removed) and membership_hash, which downstream steps
+            can use to skip the unchanged OGs.
+        Other parameters: see streaming_file_creation.
+    '''
+    identifiants = load_bacteria_identifiers(species_file, level)
+    gene_names = load_gene_names(OGs_tab_file)
+    previous = load_previous_og_table(previous_output)
+    seen_ids = set()
+    written_ids = set()
+    counts = {'added': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+
+    with open_compressed(final_output, "w") as fo, open_compressed(manifest, "w") as mf, open_compressed(OrthoDB_file, "r") as of:
+        fo.write("OG_id\tgene_id\tspecies_id\tgene_name\n")
+        mf.write("OG_id\tstatus\tmembership_hash\n")
+        for OG_id, values, bacterial_values in iter_bacterial_og_groups(of, identifiants, seen_ids, OrthoDB_file):
+            written_ids.add(OG_id)
+            new_hash = membership_hash(values, gene_names.get(OG_id, ""))
+            previous_hash = previous.get(OG_id)
+            if previous_hash == new_hash:
+                status = 'unchanged'
+            else:
+                status = 'added' if previous_hash is None else 'changed'
+            fo.write(format_og_line(OG_id, values, gene_names))
+            counts[status] += 1
+            mf.write(f"{OG_id}\t{status}\t{new_hash}\n")
+
+        for OG_id, previous_hash in previous.items():
+            if OG_id not in written_ids:
+                counts['removed'] += 1
+                mf.write(f"{OG_id}\tremoved\t{previous_hash}\n")
+
+    print(f"OGs added: {counts['added']}, changed: {counts['changed']}, unchanged: {counts['unchanged']}, removed: {counts['removed']}")
+    print("Finished. The final file containing one line per bacterial OG is here :",final_output)
+    print("The change manifest is here :",manifest)
+
+##################################################################################################################################################
+#
+# PARALLELISATION
+#
+##################################################################################################################################################
+
+def find_og_boundary(OrthoDB_file, offset):
+    '''
+    Returns the position of the first line at or after offset that starts a
+    new OG, so that no OG is split between two byte ranges.
+    '''
+    with open(OrthoDB_file, 'rb') as f:
+        f.seek(offset)
+        f.readline()
+        position = f.tell()
+        line = f.readline()
+        first_id = line.split(b'\t', 1)[0]
+        while line and line.split(b'\t', 1)[0] == first_id:
+            position = f.tell()
+            line = f.readline()
+        return position
+
+def compute_byte_ranges(OrthoDB_file, nb_ranges):
+    '''
+    Splits OrthoDB_file into at most nb_ranges (start, end) byte ranges of
+    similar size, aligned on OG boundaries.
+    '''
+    file_size = os.path.getsize(OrthoDB_file)
+    boundaries = [0]
+    for i in range(1, nb_ranges):
+        boundary = find_og_boundary(OrthoDB_file, file_size * i // nb_ranges)
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    if file_size > boundaries[-1]:
+        boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def read_byte_range(OrthoDB_file, start, end):
+    '''
+    Yields the decoded lines of OrthoDB_file between the positions start and end.
+    '''
+    with open(OrthoDB_file, 'rb') as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode()
+
+# Shared by the workers of parallel_file_creation, set once per process by init_worker
+worker_data = {}
+
+def init_worker(identifiants, gene_names):
+    '''
+    Initializer of the worker processes: the bacterial species set and the gene
+    names are inherited once per process instead of being sent with each range.
+    '''
+    worker_data['identifiants'] = identifiants
+    worker_data['gene_names'] = gene_names
+
+def scan_byte_range(OrthoDB_file, start, end, tmp_dir, keep_bacteria_lines):
+    '''
+    Worker of parallel_file_creation: filters the OGs of one byte range and
+    writes their formatted lines (and optionally their bacterial lines) to
+    temporary files in tmp_dir.
+
+    Returns (OG_ids, seen_ids, output_path, bacteria_line_path), OG_ids being
+    the bacterial OGs of the range in file order and seen_ids all the OGs of
+    the range, checked to be contiguous within it (see iter_og_groups).
+    '''
+    OG_ids = []
+    seen_ids = set()
+    output_path = os.path.join(tmp_dir, f"range_{start}.tab")
+    bacteria_line_path = os.path.join(tmp_dir, f"range_{start}_bacteria.tab") if keep_bacteria_lines else None
+
+    with ExitStack() as stack:
+        fo = stack.enter_context(open(output_path, "w"))
+        blf = stack.enter_context(open(bacteria_line_path, "w")) if bacteria_line_path else None
+        lines = read_byte_range(OrthoDB_file, start, end)
+        for OG_id, values, bacterial_values in iter_bacterial_og_groups(lines, worker_data['identifiants'], seen_ids, OrthoDB_file):
+            OG_ids.append(OG_id)
+            fo.write(format_og_line(OG_id, values, worker_data['gene_names']))
+            if blf:
+                blf.writelines(f"{OG_id}\t{value}\n" for value in bacterial_values)
+
+    return OG_ids, seen_ids, output_path, bacteria_line_path
+
+def parallel_file_creation(OrthoDB_file, species_file, final_output, OGs_tab_file, threads, bacteria_line_file=None, uniq_OG=None, level=2):
+    '''
+    Multi-process version of streaming_file_creation.
+
+    odb11v0_OG2genes.tab is split into byte ranges aligned on OG boundaries
+    (compute_byte_ranges), each range is filtered by its own worker, and the
+    per-range results are concatenated in file order, so the output is
+    identical to the one of streaming_file_creation.
+
+    Parameters:
+        threads (int): number of worker processes.
+        Other parameters: see streaming_file_creation.
+    '''
+    identifiants = load_bacteria_identifiers(species_file, level)
+    gene_names = load_gene_names(OGs_tab_file)
+    byte_ranges = compute_byte_ranges(OrthoDB_file, threads * 4)
+    seen_ids = set()
+
+    tmp_dir = tempfile.mkdtemp(prefix="tmp_bacterial_OG_", dir=os.path.dirname(os.path.abspath(final_output)))
+    try:
+        with ProcessPoolExecutor(max_workers=threads, initializer=init_worker, initargs=(identifiants, gene_names)) as executor:
+            futures = [executor.submit(scan_byte_range, OrthoDB_file, start, end, tmp_dir, bacteria_line_file is not None)
+                       for start, end in byte_ranges]
+
+            with ExitStack() as stack:
+                fo = stack.enter_context(open_compressed(final_output, "w"))
+                blf = stack.enter_context(open_compressed(bacteria_line_file, "w")) if bacteria_line_file else None
+                ug = stack.enter_context(open_compressed(uniq_OG, "w")) if uniq_OG else None
+
+                fo.write("OG_id\tgene_id\tspecies_id\tgene_name\n")
+                for future in futures:
+                    OG_ids, range_ids, output_path, bacteria_line_path = future.result()
+                    # An OG split over two ranges, bacterial or not
+                    for OG_id in range_ids:
+                        check_og_not_split(OG_id, seen_ids, OrthoDB_file)
+                    with open(output_path, "r") as range_file:
+                        shutil.copyfileobj(range_file, fo)
+                    os.remove(output_path)
+                    if blf:
+                        with open(bacteria_line_path, "r") as range_file:
+                            shutil.copyfileobj(range_file, blf)
+                        os.remove(bacteria_line_path)
+                    if ug:
+                        ug.writelines(OG_id + '\n' for OG_id in OG_ids)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print("Finished. The final file containing one line per bacterial OG is here :",final_output)
+
 ##################################################################################################################################################
 #
 # MAIN
@@ -160,20 +594,54 @@ def main():
     parser = argparse.ArgumentParser(
         description="The purpose of this script is to filter data in OrthoDB to retrieve only bacteria and format an output file with the header: OG_id gene_id species_id gene_name\
                      ",
-        epilog="Exemple: python formatting_bacterial_orthologue_file.py -o ../Orthodb/odb11v0_OG2genes.tab -b only_line_bacteria.txt -u uniq_og_ids.txt -s ../Orthodb/odb11v0_level2species.tab -g ../Orthodb/odb11v0_OGs.tab -f Bacterial_OG.tab"
+        epilog="All the input and output files can be compressed (.gz, .bz2 or .zst). Exemple: python formatting_bacterial_orthologue_file.py -o ../Orthodb/odb11v0_OG2genes.tab -b only_line_bacteria.txt -u uniq_og_ids.txt -s ../Orthodb/odb11v0_level2species.tab -g ../Orthodb/odb11v0_OGs.tab -f Bacterial_OG.tab"
             )
     parser.add_argument('-o','--orthoDB_file',dest="OrthoDB_file", help="INPUT: odb11v0_OG2genes.tab",required=True)
-    parser.add_argument('-g','--OGs_tab_file', dest="OGs_tab_file", help="INPUT: file containing OG IDs and gene names : odb11v0_OGs.tab",required=True)
+    parser.add_argument('-g','--OGs_tab_file', dest="OGs_tab_file", help="INPUT: file containing OG IDs and gene names : odb11v0_OGs.tab, or its index built by orthodb_utils/og_index.py",required=True)
     parser.add_argument('-s','--species_file', dest="species_file", help="INPUT: file containing bacterial species identifiers : odb11v0_level2species.tab",required=True)
-    parser.add_argument('-b','--bacteria_line_file', dest="bacteria_line_file", help="OUTPUT: file with lines from odb11v0_OG2genes.tab corresponding only to the kingdom bacteria",required=True)
-    parser.add_argument('-u','--uniq_OG', dest="uniq_OG", help="OUTPUT: file containing unduplicated ortholog identifiers",required=True)
+    parser.add_argument('-b','--bacteria_line_file', dest="bacteria_line_file", help="OUTPUT: file with lines from odb11v0_OG2genes.tab corresponding only to the kingdom bacteria (optional with --streaming)")
+    parser.add_argument('-u','--uniq_OG', dest="uniq_OG", help="OUTPUT: file containing unduplicated ortholog identifiers (optional with --streaming)")
     parser.add_argument('-f','--final_output', dest="final_output", help="OUTPUT: final output containing one line per bacterial OG",required=True)
+    parser.add_argument('--streaming', action='store_true', help="read odb11v0_OG2genes.tab only once and write the final output directly, grouping the lines of each OG on the fly. The lines of each OG must be contiguous (an error is raised otherwise). The OGs are written in the order of odb11v0_OG2genes.tab")
+    parser.add_argument('-t','--threads', type=int, default=1, help="number of processes used with --streaming: odb11v0_OG2genes.tab is split into byte ranges filtered in parallel (default: 1)")
+    parser.add_argument('-l','--level', type=int, default=2, help="NCBI taxid of the taxonomic level whose OGs are kept, read from odb11v0_level2species.tab (default: 2, Bacteria; e.g. 2157 for Archaea)")
+    parser.add_argument('-m','--memory_budget', type=int, help="without --streaming, approximate memory (in MB) used to group the genes by OG: beyond it, they are sorted and spilled to temporary files next to the final output. The output is the same as without this option")
+    parser.add_argument('--previous', dest="previous", help="INPUT (optional, with --streaming): final output of the previous OrthoDB release. The final output is the same as a full --streaming rebuild: this option only adds a change manifest comparing each OG (genes and gene name) with the previous release (see --manifest)")
+    parser.add_argument('--manifest', dest="manifest", default="Bacterial_OG_changes.tab", help="OUTPUT: change manifest written with --previous: OG_id, status (added, changed, unchanged, removed) and membership hash (default: Bacterial_OG_changes.tab)")
+    parser.add_argument('--store', dest="store", help="OUTPUT (optional): directory where the final output is also exported as a columnar OG store, readable by search_taxid_and_monocopy_and_percentage_calculation.py")
     args = parser.parse_args()
 
+    if args.threads < 1:
+        parser.error("-t/--threads must be at least 1")
+    if args.threads > 1 and not args.streaming:
+        parser.error("-t/--threads requires --streaming")
+    if args.memory_budget is not None and (args.streaming or args.memory_budget < 1):
+        parser.error("-m/--memory_budget must be at least 1 and cannot be used with --streaming")
+    if args.previous and (not args.streaming or args.threads > 1):
+        parser.error("--previous requires --streaming and a single thread")
+    if not args.streaming and (args.bacteria_line_file is None or args.uniq_OG is None):
+        parser.error("the arguments -b/--bacteria_line_file and -u/--uniq_OG are required without --streaming")
+
+    if args.threads > 1 and is_compressed(args.OrthoDB_file):
+        print("A compressed odb11v0_OG2genes.tab cannot be split into byte ranges: it is read by a single process, decompressed in parallel when pigz, lbzip2/pbzip2 or zstd is available.")
+        args.threads = 1
+
     try:
-        extract_line_bacteria(args.OrthoDB_file, args.bacteria_line_file, args.species_file)
-        extract_unique_og_ids(args.bacteria_line_file, args.uniq_OG)
-        file_creation(args.uniq_OG, args.OrthoDB_file, args.final_output, args.OGs_tab_file)
+        if args.previous:
+            incremental_file_creation(args.previous, args.OrthoDB_file, args.species_file, args.final_output, args.OGs_tab_file, args.manifest, args.level)
+        elif args.threads > 1:
+            parallel_file_creation(args.OrthoDB_file, args.species_file, args.final_output, args.OGs_tab_file, args.threads, args.bacteria_line_file, args.uniq_OG, args.level)
+        elif args.streaming:
+            streaming_file_creation(args.OrthoDB_file, args.species_file, args.final_output, args.OGs_tab_file, args.bacteria_line_file, args.uniq_OG, args.level)
+        else:
+            extract_line_bacteria(args.OrthoDB_file, args.bacteria_line_file, args.species_file, args.level)
+            extract_unique_og_ids(args.bacteria_line_file, args.uniq_OG)
+            if args.memory_budget:
+                external_file_creation(args.uniq_OG, args.OrthoDB_file, args.final_output, args.OGs_tab_file, args.memory_budget)
+            else:
+                file_creation(args.uniq_OG, args.OrthoDB_file, args.final_output, args.OGs_tab_file)
+        if args.store:
+            export_og_store(args.final_output, args.store)
     except Exception as e:
         print(f"an error has occured : {str(e)}")
         sys.exit(1)
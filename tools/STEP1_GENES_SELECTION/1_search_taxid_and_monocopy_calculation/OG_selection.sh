@@ -72,4 +72,15 @@ if [ ! -e "$data_file" ]; then
 fi
 
 # Use Awk to filter lines based on the given criteria
-awk -F '\t' -v col5="$percent_single_copy" -v col10="$TargetSpecies_Count" -v col11="$TargetSpecies_Percentage" '$5 >= col5 && $10 >= col10 && $11 >= col11' "$data_file" > "$output_file"
+# The columns are found by their name in the header, so the full and the slim (--slim) tables are both read
+awk -F '\t' -v col5="$percent_single_copy" -v col10="$TargetSpecies_Count" -v col11="$TargetSpecies_Percentage" '
+NR == 1 {
+    for (i = 1; i <= NF; i++) column[$i] = i
+    if (!("percent_single_copy" in column) || !("TargetSpecies_Count" in column) || !("TargetSpecies_Percentage" in column)) {
+        print "The header of the data file has no percent_single_copy, TargetSpecies_Count or TargetSpecies_Percentage column." > "/dev/stderr"
+        exit 1
+    }
+    print
+    next
+}
+$column["percent_single_copy"] >= col5 && $column["TargetSpecies_Count"] >= col10 && $column["TargetSpecies_Percentage"] >= col11' "$data_file" > "$output_file"
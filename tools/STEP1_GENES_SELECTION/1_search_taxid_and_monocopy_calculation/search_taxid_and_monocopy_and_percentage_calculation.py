@@ -1,14 +1,24 @@
 #!/usr/bin/env python
 
 import argparse
-import subprocess
 import csv
 import gzip
+import numpy as np
 import pandas as pd
 from concurrent.futures import ProcessPoolExecutor
 import os
-import shutil
+import re
 import sys 
+from collections import Counter, deque
+from functools import partial
+from itertools import islice
+from contextlib import ExitStack
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'orthodb_utils'))
+from level2species import species_at_level
+from og_store import is_og_store, load_og_store, iter_og_store_rows, matching_og_indices, og_store_genes, og_store_row, species_mask
+from og_results import SLIM_FIELDNAMES, MEMBER_FIELDNAMES, members_path
+from compressed_io import open_compressed
 
 __author__ = 'Gabryelle Agoutin - INRAE'
 __copyright__ = 'Copyright (C) 2024 INRAE'
@@ -17,6 +27,9 @@ __version__ = '1.0'
 __email__ = 'gabryelle.agoutin@inrae.fr'
 __status__ = 'prod'
 
+# Part of a protein ID after the organism (e.g. ':000589' in 1000588_0:000589)
+PROTEIN_SUFFIX = re.compile(r':[^;]*')
+
 
 ##################################################################################################################################################
 #
@@ -24,14 +37,59 @@ __status__ = 'prod'
 #
 ##################################################################################################################################################
 
-def parse_OG_file(identifiers_with_searchID_in_taxonomy, input_file_path, taxid_to_species, min_genomes_threshold=1):
+def iter_matching_lines(identifiers_with_searchID_in_taxonomy, lines):
+    """
+    Yield (OG_ID, ProteinID, SpeciesID, GeneName) for each line of the OG file containing at least one of the identifiers.
+    """
+    # Hashed lookups: the test costs one lookup per species of the OG, and stops at the first target species found
+    if not isinstance(identifiers_with_searchID_in_taxonomy, (set, frozenset)):
+        identifiers_with_searchID_in_taxonomy = set(identifiers_with_searchID_in_taxonomy)
+
+    for line in lines:
+        columns = line.strip().split('\t')
+        if len(columns) >= 3:
+            if not identifiers_with_searchID_in_taxonomy.isdisjoint(columns[2].split(';')):
+                OG_ID, ProteinID, SpeciesID ,GeneName = line.strip().split('\t')
+                yield OG_ID, ProteinID, SpeciesID, GeneName
+
+def iter_matching_OGs(identifiers_with_searchID_in_taxonomy, input_file_path, og_range=None, lines=None):
+    """
+    Yield (OG_ID, ProteinID, SpeciesID, GeneName) for each OG of the input containing at least one of the identifiers.
+
+    :param identifiers_with_searchID_in_taxonomy: Set of identifiers with desired ID in their taxonomy
+    :param input_file_path: Path to the input OG file (optionally gzipped) or to an OG store directory (see orthodb_utils/og_store.py)
+    :param og_range: (start, end) to read only the OGs start to end - 1 of an OG store
+    :param lines: lines of the OG file to read instead of the whole file
+
+    For an OG store, the test is vectorized over batches of OGs (see orthodb_utils/og_store.py matching_og_indices).
+    """
+    if lines is not None:
+        yield from iter_matching_lines(identifiers_with_searchID_in_taxonomy, lines)
+        return
+
+    if is_og_store(input_file_path):
+        store = load_og_store(input_file_path)
+        yield from iter_og_store_rows(store, identifiers_with_searchID_in_taxonomy, og_range)
+        return
+
+    proper_open = gzip.open if input_file_path.endswith('.gz') else open
+    with proper_open(input_file_path, 'rt') as input_file:
+        yield from iter_matching_lines(identifiers_with_searchID_in_taxonomy, input_file)
+
+def parse_OG_file(identifiers_with_searchID_in_taxonomy, input_file_path, taxid_to_species, min_genomes_threshold=1, og_range=None, lines=None, allow_empty=False, thresholds=None, copy_numbers=False):
     """
     Parse the Orthologous Groups (OG) file, extracting relevant information based on specified criteria.
 
     :param identifiers_with_searchID_in_taxonomy: Set of identifiers with desired ID in their taxonomy
-    :param input_file_path: Path to the input OG file with all bacterian OG
+    :param input_file_path: Path to the input OG file with all bacterian OG, or to an OG store directory
     :param taxid_to_species: Dictionary mapping taxonomy IDs to species names.
     :param min_genomes_threshold: Minimal number of genomes for selecting OGs (default is 1).
+    :param og_range: (start, end) to read only the OGs start to end - 1 of an OG store
+    :param lines: lines of the OG file to read instead of the whole file (one batch of the file)
+    :param allow_empty: return an empty list instead of raising a ValueError when no OG is selected
+    :param thresholds: Dictionary of minimal values of 'percent_single_copy', 'TargetSpecies_Count' and 'TargetSpecies_Percentage'
+        (the criteria of OG_selection.sh). The OGs below one of them are discarded during the scan (default: no threshold).
+    :param copy_numbers: add the copy-number histograms of the OG, 'TargetCopyNumbers' and 'OtherCopyNumbers' (see copy_number_histograms)
     :return: List of dictionaries containing extracted information for each OG.
 
     The OG file is tab-delimited and expected to have the following columns:
@@ -56,83 +114,239 @@ def parse_OG_file(identifiers_with_searchID_in_taxonomy, input_file_path, taxid_
     If no OGs meet the criteria, a ValueError is raised.
     """
 
-    cogs = []
-    proper_open = gzip.open if input_file_path.endswith('.gz') else open
-    taxids_set = set()
-
-    with proper_open(input_file_path, 'r') as input_file:
-        for line in input_file:
-            columns = line.strip().split('\t')
-            if len(columns) >= 3:
-                ids_in_column = columns[2].split(';')
-                matching_ids = [id for id in identifiers_with_searchID_in_taxonomy if id in ids_in_column]
-                if matching_ids:
-                    OG_ID, ProteinID, SpeciesID ,GeneName = line.strip().split('\t')
-                    tax_ids = [taxid.split(':')[0] for taxid in ProteinID.split(';')]
-                    sp_count = len(tax_ids)
-
-                    if sp_count >= min_genomes_threshold:
-                        prot_count = 0
-                        copy_counts = {}
-                        for protid in tax_ids:
-                            if protid in copy_counts:
-                                copy_counts[protid] += 1
-                            else:
-                                copy_counts[protid] = 1
-
-                        new_taxid = set(SpeciesID.split(';'))
-
-                        nb_single_copy = sum((1 for gene_copy in copy_counts.values() if gene_copy == 1))
-
-                        target_species_count = sum(1 for taxid in new_taxid if taxid in identifiers_with_searchID_in_taxonomy)
-                        target_species_percentage = (target_species_count / len(new_taxid)) * 100 if new_taxid else 0
-
-                        cog = {'OG_ID': OG_ID,
-                               'ProteinCount': int(sp_count),
-                               'SpeciesCount': int(len(new_taxid)),
-                               'nb_single_copy': int(nb_single_copy),
-                               'percent_single_copy': (int(nb_single_copy) / int(len(copy_counts))) * 100,
-                               'ProteinID': ProteinID,
-                               'taxids': new_taxid,
-                               'species': map_species(new_taxid, taxid_to_species),
-                               'gene_name': GeneName,
-                               'TargetSpecies_Count': target_species_count,
-                               'TargetSpecies_Percentage': round(target_species_percentage, 2)
-                               }
-
-                        cogs.append(cog)
-
-    if len(cogs) == 0:
+    cogs = parse_OG_file_by_clade({None: identifiers_with_searchID_in_taxonomy}, input_file_path, taxid_to_species, min_genomes_threshold, og_range, lines, thresholds, copy_numbers)[None]
+
+    if len(cogs) == 0 and not allow_empty:
         raise ValueError('No COGs identified due to the min_genome_threshold')
     return cogs
 
-def filter_matching_lines(input_file_path, search_ID, level2species_path):
+def iter_OG_batches(identifiers_with_searchID_in_taxonomy, input_file_path, og_range=None, lines=None, batch_size=10000):
     """
-    Search for the IDs of species that have the desired ID in their taxonomy.
+    Yield the OGs of the input containing at least one of the identifiers, by batches of at most batch_size OGs.
+
+    Each batch is a dictionary with:
+    - 'rows': the OGs of the batch, to be decoded by 'decode'
+    - 'decode': function returning (OG_ID, ProteinID, SpeciesID, GeneName) from an element of 'rows'
+    and, for an OG store, the integer codes of the OGs, ready for OG_statistics:
+    - 'organism_codes', 'organism_offsets': the organisms of the k-th OG are organism_codes[organism_offsets[k]:organism_offsets[k + 1]]
+    - 'species_codes', 'species_offsets': same for the species
+    - 'species_vocabulary': taxid of each species code
+
+    The taxids of an OG store are integer-encoded once for the whole file, so an OG is only decoded if 'decode' is called for it.
+    The rows of an OG file are given as they are.
+    """
+    if lines is None and is_og_store(input_file_path):
+        store = load_og_store(input_file_path)
+        mask = species_mask(store, identifiers_with_searchID_in_taxonomy)
+        start, end = og_range if og_range is not None else (0, len(store['og_ids']))
+        for batch_start in range(start, end, batch_size):
+            indices = matching_og_indices(store, mask, (batch_start, min(batch_start + batch_size, end)))
+            if len(indices) == 0:
+                continue
+            organism_codes, organism_offsets = og_store_genes(store, indices)
+            yield {'rows': indices, 'decode': partial(og_store_row, store),
+                   'organism_codes': organism_codes, 'organism_offsets': organism_offsets,
+                   'species_codes': store['organism_species'][organism_codes], 'species_offsets': organism_offsets,
+                   'species_vocabulary': store['species']}
+        return
+
+    matching_OGs = iter_matching_OGs(identifiers_with_searchID_in_taxonomy, input_file_path, og_range, lines)
+    while True:
+        rows = list(islice(matching_OGs, batch_size))
+        if not rows:
+            return
+        yield {'rows': rows, 'decode': tuple}
+
+def OG_row_statistics(rows, targets, min_genomes_threshold=1, min_percent_single_copy=0):
     """
-    command = f"grep -w {search_ID} {level2species_path} | cut -f2"
-    result = subprocess.check_output(command, shell=True, text=True)
+    Same statistics as OG_statistics, for a batch of OG rows (OG_ID, ProteinID, SpeciesID, GeneName), plus 'species': the set of
+    the species of each OG, reused for its 'taxids' column.
 
-    identifiers_with_searchID_in_taxonomy = set(result.strip().split('\n'))
-    identifiers_with_searchID_in_taxonomy = {id.split('_')[0] for id in identifiers_with_searchID_in_taxonomy}
-    return identifiers_with_searchID_in_taxonomy
+    :param targets: List of the sets of target species of each clade
+    :param min_genomes_threshold, min_percent_single_copy: the species of the OGs below these thresholds are not read (their
+        species counts are left to 0, so they are not selected)
+
+    The copies of each organism (prefix of the protein IDs, before ':') are counted by a Counter on the ProteinID column, with its
+    suffixes removed by a single regular expression. For text, hashing the strings is the main cost, so encoding them into
+    integers first would not pay off.
+    """
+    protein_count, nb_organisms, nb_single_copy, species_count, species_sets = [], [], [], [], []
+    target_counts = [[] for _ in targets]
+    for _, ProteinID, SpeciesID, _ in rows:
+        copies = list(Counter(PROTEIN_SUFFIX.sub('', ProteinID).split(';')).values())
+        protein_count.append(sum(copies))
+        nb_organisms.append(len(copies))
+        nb_single_copy.append(copies.count(1))
+        if protein_count[-1] >= min_genomes_threshold and (copies.count(1) / len(copies)) * 100 >= min_percent_single_copy:
+            species = set(SpeciesID.split(';'))
+        else:
+            species = set()
+        species_sets.append(species)
+        species_count.append(len(species))
+        for counts, identifiers in zip(target_counts, targets):
+            counts.append(len(species.intersection(identifiers)))
+    return {'ProteinCount': np.array(protein_count, dtype=np.int64),
+            'nb_organisms': np.array(nb_organisms, dtype=np.int64),
+            'nb_single_copy': np.array(nb_single_copy, dtype=np.int64),
+            'SpeciesCount': np.array(species_count, dtype=np.int64),
+            'TargetSpecies_Count': [np.array(counts, dtype=np.int64) for counts in target_counts],
+            'species': species_sets}
+
+def count_keys(keys):
+    """
+    Returns the distinct values of the integer array keys, sorted, and their number of occurrences.
+    """
+    keys = np.sort(keys)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], np.diff(np.append(starts, len(keys)))
+
+def OG_statistics(organism_codes, organism_offsets, species_codes, species_offsets, target_masks):
+    """
+    Vectorized statistics of a batch of integer-encoded OGs (see iter_OG_batches).
+
+    :param target_masks: List of boolean arrays over the species codes, True for the target species of each clade
+    :return: Dictionary of arrays with one value per OG: 'ProteinCount', 'nb_organisms' (number of distinct organisms),
+        'nb_single_copy' (organisms with exactly one protein), 'SpeciesCount' (number of distinct species), and
+        'TargetSpecies_Count', the list of the number of distinct target species of each clade.
+
+    The (OG, organism) and (OG, species) pairs are counted on a single integer key (see count_keys), then reduced per OG by np.bincount.
+    """
+    nb_og = len(organism_offsets) - 1
+    protein_count = np.diff(organism_offsets)
+
+    nb_organism_codes = int(organism_codes.max()) + 1 if len(organism_codes) else 1
+    organism_pairs, copies = count_keys(np.repeat(np.arange(nb_og, dtype=np.int64), protein_count) * nb_organism_codes + organism_codes)
+    organism_pair_OGs = organism_pairs // nb_organism_codes
+
+    nb_species_codes = int(species_codes.max()) + 1 if len(species_codes) else 1
+    species_pairs, _ = count_keys(np.repeat(np.arange(nb_og, dtype=np.int64), np.diff(species_offsets)) * nb_species_codes + species_codes)
+    species_pair_OGs = species_pairs // nb_species_codes
+    species_pair_codes = species_pairs % nb_species_codes
+
+    return {'ProteinCount': protein_count,
+            'nb_organisms': np.bincount(organism_pair_OGs, minlength=nb_og),
+            'nb_single_copy': np.bincount(organism_pair_OGs[copies == 1], minlength=nb_og),
+            'SpeciesCount': np.bincount(species_pair_OGs, minlength=nb_og),
+            'TargetSpecies_Count': [np.bincount(species_pair_OGs[mask[species_pair_codes]], minlength=nb_og) for mask in target_masks]}
+
+def parse_OG_file_by_clade(identifiers_by_search_ID, input_file_path, taxid_to_species, min_genomes_threshold=1, og_range=None, lines=None, thresholds=None, copy_numbers=False):
+    """
+    Multi-clade version of parse_OG_file: the input is read once for all the clades.
+
+    :param identifiers_by_search_ID: Dictionary mapping each search_ID to its set of identifiers (see filter_matching_lines)
+    :return: Dictionary mapping each search_ID to the list of dictionaries of its selected OGs (see parse_OG_file).
+
+    The counts of the OGs are computed by batch (see iter_OG_batches): with NumPy on the integer-encoded taxids of an OG store
+    (OG_statistics), with a Counter per OG for an OG file (OG_row_statistics). The minimal number of genomes, the
+    percent_single_copy threshold and the presence of target species are then tested on whole arrays. Only the remaining OGs are decoded, to compute 'TargetSpecies_Percentage' for each clade present in the OG
+    and the clade-independent columns (taxids, species names) once.
+    The thresholds (see parse_OG_file) are checked as soon as their value is known, so the species names of an OG are
+    only looked up if it is selected for at least one clade.
+    """
+    thresholds = thresholds or {}
+    min_percent_single_copy = thresholds.get('percent_single_copy', 0)
+    min_target_species_count = thresholds.get('TargetSpecies_Count', 0)
+    min_target_species_percentage = thresholds.get('TargetSpecies_Percentage', 0)
+    cogs_by_search_ID = {search_ID: [] for search_ID in identifiers_by_search_ID}
+    all_identifiers = frozenset().union(*identifiers_by_search_ID.values())
+
+    species_vocabulary = None
+    for batch in iter_OG_batches(all_identifiers, input_file_path, og_range, lines):
+        if 'organism_codes' not in batch:
+            stats = OG_row_statistics(batch['rows'], list(identifiers_by_search_ID.values()), min_genomes_threshold, min_percent_single_copy)
+        else:
+            if batch['species_vocabulary'] is not species_vocabulary:
+                species_vocabulary = batch['species_vocabulary']
+                target_masks = [np.array([taxid in identifiers for taxid in species_vocabulary], dtype=bool)
+                                for identifiers in identifiers_by_search_ID.values()]
+            stats = OG_statistics(batch['organism_codes'], batch['organism_offsets'], batch['species_codes'], batch['species_offsets'], target_masks)
+
+        candidates = (stats['ProteinCount'] >= min_genomes_threshold) & (stats['nb_organisms'] > 0)
+        candidates &= (stats['nb_single_copy'] / np.maximum(stats['nb_organisms'], 1)) * 100 >= min_percent_single_copy
+        candidates &= np.logical_or.reduce([target_count > 0 for target_count in stats['TargetSpecies_Count']])
+
+        # Python integers for the remaining OGs: the columns must be exactly those of the per-OG computation
+        protein_counts, nb_organisms, nb_single_copies, species_counts = (stats[name].tolist() for name in ('ProteinCount', 'nb_organisms', 'nb_single_copy', 'SpeciesCount'))
+        target_counts = [target_count.tolist() for target_count in stats['TargetSpecies_Count']]
+        for k in np.flatnonzero(candidates).tolist():
+            nb_single_copy = nb_single_copies[k]
+            percent_single_copy = (nb_single_copy / nb_organisms[k]) * 100
+            species_count = species_counts[k]
+
+            target_stats = []
+            for search_ID, target_count in zip(identifiers_by_search_ID, target_counts):
+                target_species_count = target_count[k]
+                if target_species_count == 0:
+                    continue
+                target_species_percentage = round((target_species_count / species_count) * 100, 2)
+                if target_species_count < min_target_species_count or target_species_percentage < min_target_species_percentage:
+                    continue
+                target_stats.append((search_ID, target_species_count, target_species_percentage))
+            if not target_stats:
+                continue
+
+            OG_ID, ProteinID, SpeciesID, GeneName = batch['decode'](batch['rows'][k])
+            new_taxid = stats['species'][k] if 'species' in stats else set(SpeciesID.split(';'))
+            og_stats = {'OG_ID': OG_ID,
+                        'ProteinCount': protein_counts[k],
+                        'SpeciesCount': species_count,
+                        'nb_single_copy': nb_single_copy,
+                        'percent_single_copy': percent_single_copy,
+                        'ProteinID': ProteinID,
+                        'taxids': new_taxid,
+                        'species': map_species(new_taxid, taxid_to_species),
+                        'gene_name': GeneName
+                        }
+
+            for search_ID, target_species_count, target_species_percentage in target_stats:
+                cog = dict(og_stats)
+                cog['TargetSpecies_Count'] = target_species_count
+                cog['TargetSpecies_Percentage'] = target_species_percentage
+                if copy_numbers:
+                    cog['TargetCopyNumbers'], cog['OtherCopyNumbers'] = copy_number_histograms(ProteinID, identifiers_by_search_ID[search_ID])
+                cogs_by_search_ID[search_ID].append(cog)
+
+    return cogs_by_search_ID
+
+def format_histogram(histogram):
+    """
+    Formats a histogram {copies: number of organisms} as 'copies:number' pairs sorted by copies, e.g. '1:40,2:3'.
+    """
+    return ','.join(f"{copies}:{number}" for copies, number in sorted(histogram.items()))
+
+def copy_number_histograms(ProteinID, identifiers_with_searchID_in_taxonomy):
+    """
+    Copy-number histograms of an OG, split into target and non-target species.
+
+    :param ProteinID: ProteinID column of the OG (organism:gene, separated by ';')
+    :param identifiers_with_searchID_in_taxonomy: Set of the target species
+    :return: (target, other): the number of organisms having each number of copies of the gene, for the organisms of the target
+        species and for the others, formatted by format_histogram. '1:40,2:3' means 40 organisms with a single copy and 3 with two
+        copies: as for nb_single_copy, the copies are counted per organism.
+
+    The histograms give the single-copy rate in the target clade alone (e.g. 40 / 43) and let other thresholds be explored without
+    reading the OG file again.
+    """
+    target, other = Counter(), Counter()
+    for organism, copies in Counter(PROTEIN_SUFFIX.sub('', ProteinID).split(';')).items():
+        if organism.split('_')[0] in identifiers_with_searchID_in_taxonomy:
+            target[copies] += 1
+        else:
+            other[copies] += 1
+    return format_histogram(target), format_histogram(other)
 
 def filter_matching_lines(input_file_path, search_ID, level2species_path):
     """
     Search for the IDs of species that have the desired ID in their taxonomy.
+
+    The level -> species index of level2species_path is built once and cached on disk (see orthodb_utils/level2species.py).
     """
-    command = f"grep -w {search_ID} {level2species_path} | cut -f2"
-    try:
-        result = subprocess.check_output(command, shell=True, text=True)
-    except subprocess.CalledProcessError:
-        raise ValueError("Your taxonomic identifier is not found in the OrthoDB database. "
-                         "Check it. If it is correct, it may not yet be in the database.")
+    identifiers_with_searchID_in_taxonomy = species_at_level(level2species_path, search_ID)
 
-    if not result.strip():
+    if not identifiers_with_searchID_in_taxonomy:
         raise ValueError("Your taxonomic identifier is not found in the OrthoDB database. "
                          "Check it. If it is correct, it may not yet be in the database.")
 
-    identifiers_with_searchID_in_taxonomy = set(result.strip().split('\n'))
     identifiers_with_searchID_in_taxonomy = {id_.split('_')[0] for id_ in identifiers_with_searchID_in_taxonomy}
     return identifiers_with_searchID_in_taxonomy
     
@@ -149,34 +363,116 @@ def map_species(taxids, taxid_to_species):
 #
 ##################################################################################################################################################
 
-def process_file(input_file, search_ID, taxid_to_species, min_genomes_threshold, output_file, level2species_path):
+FIELDNAMES = ['OG_ID', 'ProteinCount', 'SpeciesCount', 'nb_single_copy', 'percent_single_copy', 'ProteinID', 'taxids', 'species', 'gene_name', 'TargetSpecies_Count', 'TargetSpecies_Percentage']
+# Columns added at the end of the table by --copy_numbers
+COPY_NUMBER_FIELDNAMES = ['TargetCopyNumbers', 'OtherCopyNumbers']
+
+# Shared by the worker processes, set once per process by init_worker
+worker_data = {}
+
+def init_worker(identifiers_by_search_ID, taxid_to_species, thresholds=None, copy_numbers=False):
     """
-    Processes the input file in chunks, searching for identifiers with the specified ID in their taxonomy and calling process_input_file.
+    Initializer of the worker processes: the target taxids of each clade and the taxid -> species names dictionary are
+    computed once by the parent and inherited by each worker (through fork), instead of being recomputed or sent with
+    every batch. The thresholds of the selection and the copy_numbers option (see parse_OG_file) are shared the same way.
     """
-    identifiers_with_searchID_in_taxonomy = filter_matching_lines(input_file, search_ID, level2species_path)
-    process_input_file({'input_file': input_file, 'search_ID': search_ID, 'min_genomes_threshold': min_genomes_threshold, 'taxid_to_species': taxid_to_species, 'output_file': output_file}, identifiers_with_searchID_in_taxonomy)
+    worker_data['identifiers_by_search_ID'] = identifiers_by_search_ID
+    worker_data['taxid_to_species'] = taxid_to_species
+    worker_data['thresholds'] = thresholds
+    worker_data['copy_numbers'] = copy_numbers
 
-def process_input_file(args, identifiers_with_searchID_in_taxonomy):
+def process_file(input_file, min_genomes_threshold, batch):
     """
-    Processes the input file in chunks, calling the parse_eggnog_members_file function.
+    Processes one batch of the input file with the target taxids of the worker (see init_worker), calling process_input_file.
+    The batch is a list of lines of the OG file, or a range of OGs (start, end) of an OG store.
+    """
+    og_range, lines = (batch, None) if isinstance(batch, tuple) else (None, batch)
+    return process_input_file({'input_file': input_file, 'min_genomes_threshold': min_genomes_threshold, 'taxid_to_species': worker_data['taxid_to_species'], 'og_range': og_range, 'lines': lines, 'thresholds': worker_data.get('thresholds'), 'copy_numbers': worker_data.get('copy_numbers', False)}, worker_data['identifiers_by_search_ID'])
+
+def process_input_file(args, identifiers_by_search_ID):
+    """
+    Processes one batch of the input file for all the clades, calling the parse_OG_file_by_clade function.
+    Returns, for each search_ID, the rows of the selected OGs, ready to be written.
     """
     taxid_to_species = args['taxid_to_species']
     input_file = args['input_file']
-    search_ID = args['search_ID']
-    output_file = args['output_file']
 
-    if not identifiers_with_searchID_in_taxonomy or (len(identifiers_with_searchID_in_taxonomy) == 1 and '' in identifiers_with_searchID_in_taxonomy):
-        raise ValueError(f'The number {search_ID} was not found in the file.')
+    for search_ID, identifiers_with_searchID_in_taxonomy in identifiers_by_search_ID.items():
+        if not identifiers_with_searchID_in_taxonomy or (len(identifiers_with_searchID_in_taxonomy) == 1 and '' in identifiers_with_searchID_in_taxonomy):
+            raise ValueError(f'The number {search_ID} was not found in the file.')
 
-    result = parse_OG_file(identifiers_with_searchID_in_taxonomy, input_file, taxid_to_species, args['min_genomes_threshold'])
+    result = parse_OG_file_by_clade(identifiers_by_search_ID, input_file, taxid_to_species, args['min_genomes_threshold'], args.get('og_range'), args.get('lines'), args.get('thresholds'), args.get('copy_numbers', False))
 
-    with open(output_file, 'a+', newline='') as tsvfile:
-        fieldnames = ['OG_ID', 'ProteinCount', 'SpeciesCount', 'nb_single_copy', 'percent_single_copy', 'ProteinID', 'taxids', 'species', 'gene_name', 'TargetSpecies_Count', 'TargetSpecies_Percentage']
-        writer = csv.DictWriter(tsvfile, fieldnames=fieldnames, delimiter='\t')
-
-        for cog in result:
+    for cogs in result.values():
+        for cog in cogs:
             cog['taxids'] = ', '.join([taxid.strip('"') for taxid in cog['taxids']])
-            writer.writerow(cog)
+    return result
+
+def iter_batches(input_file, chunk_size):
+    """
+    Producer: yields the batches of the input file, read lazily. A batch is a list of chunk_size lines of the OG file
+    (optionally gzipped), or a range of chunk_size OGs (start, end) of an OG store, which the workers read in place.
+    """
+    if is_og_store(input_file):
+        nb_og = load_og_store(input_file)['meta']['nb_og']
+        for start in range(0, nb_og, chunk_size):
+            yield (start, min(start + chunk_size, nb_og))
+        return
+
+    proper_open = gzip.open if input_file.endswith('.gz') else open
+    with proper_open(input_file, 'rt') as f:
+        chunk = []
+        for line in f:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def process_batches(input_file, search_IDs, taxid_to_species, min_genomes_threshold, level2species_path, writers, chunk_size=1000, max_workers=None, thresholds=None, copy_numbers=False):
+    """
+    Streams the batches of the input file to a pool of processes and writes the selected OGs of each clade with
+    each csv.DictWriter of writers[search_ID] (the statistics table, and its members table in slim mode), in the order of the input file, as soon as each batch is done. At most 2 batches per worker are in
+    flight, so memory stays bounded whatever the size of the input. All the clades are computed in the same scan.
+    Returns the number of OGs written for each search_ID.
+
+    The target taxids are searched once, here, and shared with the workers with taxid_to_species (see init_worker).
+    Only the OGs passing the thresholds (see parse_OG_file) are written.
+    """
+    identifiers_by_search_ID = {search_ID: frozenset(filter_matching_lines(input_file, search_ID, level2species_path))
+                                for search_ID in search_IDs}
+    max_workers = max_workers or os.cpu_count() or 1
+    nb_written = {search_ID: 0 for search_ID in search_IDs}
+
+    def write_result(result):
+        for search_ID, rows in result.items():
+            for writer in writers[search_ID]:
+                writer.writerows(rows)
+            nb_written[search_ID] += len(rows)
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                             initargs=(identifiers_by_search_ID, taxid_to_species, thresholds, copy_numbers)) as executor:
+        in_flight = deque()
+        for batch in iter_batches(input_file, chunk_size):
+            in_flight.append(executor.submit(process_file, input_file, min_genomes_threshold, batch))
+            if len(in_flight) >= 2 * max_workers:
+                write_result(in_flight.popleft().result())
+        while in_flight:
+            write_result(in_flight.popleft().result())
+    return nb_written
+
+def output_path_for(output_tsv, search_ID, nb_search_IDs):
+    """
+    Returns the output path of a clade: output_tsv formatted with {search_ID} if it contains it, output_tsv itself for a
+    single clade, otherwise output_tsv with _<search_ID> added before its extension.
+    """
+    if '{search_ID}' in output_tsv:
+        return output_tsv.format(search_ID=search_ID)
+    if nb_search_IDs == 1:
+        return output_tsv
+    root, ext = os.path.splitext(output_tsv)
+    return f"{root}_{search_ID}{ext}"
 
 ##################################################################################################################################################
 #
@@ -198,10 +494,15 @@ def main():
     - 'TargetSpecies_Count': Number of target species in the OG\
     - 'TargetSpecies_Percentage': Percentage of target species in the OG""",
        epilog="Exemple: python search_taxid_and_monocopy_calculation.py -i Bacterial_OG.tab -f ../Orthodb/odb11v0_species.tab -s 1578 -l ../Orthodb/odb11v0_level2species.tab -o OG_1578.tab")
-    parser.add_argument("-i", "--input_file", required=True,help="file containing all bacterial orthologue groups.is tab-delimited and expected to have the following columns: OG_ID,ProteinID,speciesID")
-    parser.add_argument("-s", "--search_ID", required=True, help="Identifier of the taxonomic rank you are looking for. Example: for Lactobacillus, the identifier is 1568")
+    parser.add_argument("-i", "--input_file", required=True,help="file containing all bacterial orthologue groups.is tab-delimited and expected to have the following columns: OG_ID,ProteinID,speciesID. An OG store directory made by orthodb_utils/og_store.py is also accepted")
+    parser.add_argument("-s", "--search_ID", required=True, nargs='+', help="Identifier of the taxonomic rank you are looking for. Example: for Lactobacillus, the identifier is 1568. Several identifiers can be given: all the clades are computed in the same scan of the input file, with one output file per clade (see -o)")
     parser.add_argument('--min_genomes_threshold', type=int, default=1, help='Minimal number of genomes for cog selection')
-    parser.add_argument("-o", '--output_tsv', required=True,default='OG_stat_single_copy.tsv', help='Path to the output TSV file')
+    parser.add_argument("-o", '--output_tsv', required=True,default='OG_stat_single_copy.tsv', help='Path to the output TSV file. With several -s, {search_ID} in the path is replaced by each identifier (e.g. OG_{search_ID}.tab), otherwise _<search_ID> is added before the extension')
+    parser.add_argument("-p", '--percent_single_copy', type=float, default=0, help='Minimal percent_single_copy of the selected OGs (as -p of OG_selection.sh, default: 0)')
+    parser.add_argument("-c", '--target_species_count', type=int, default=0, help='Minimal TargetSpecies_Count of the selected OGs (as -c of OG_selection.sh, default: 0)')
+    parser.add_argument("-t", '--target_species_percentage', type=float, default=0, help='Minimal TargetSpecies_Percentage of the selected OGs (as -t of OG_selection.sh, default: 0)')
+    parser.add_argument('--copy_numbers', action='store_true', help='Add the TargetCopyNumbers and OtherCopyNumbers columns: number of organisms of the target species and of the other species having each number of copies (e.g. 1:40,2:3)')
+    parser.add_argument('--slim', action='store_true', help='Write a narrow statistics table without the ProteinID, taxids and species columns, which are written in a compressed members table next to it (OG_1578.tab -> OG_1578.members.tsv.gz, read by fastas_recovery.py)')
     parser.add_argument("-f", '--species_file',required=True, help='Path to the species file (e.g., odb11v0_species.tab)')
     parser.add_argument("-l", '--level2species_file',required=True, help='Path to the level2species file (e.g., odb11v0_level2species.tab)')
     args = parser.parse_args()
@@ -214,87 +515,47 @@ def main():
         parser.error(f"The file ‘{args.species_file}’ of the OrthoDB database is not found. "
                      "Check the path if you have downloaded it correctly.")
 
-    if not os.path.isfile(args.input_file):
+    if not os.path.isfile(args.input_file) and not is_og_store(args.input_file):
         parser.error(f"The file ‘{args.input_file}’ is not found. Check the path.")
         
-    if not args.search_ID.isdigit():
-        parser.error("Your identifier contains unrecognised characters. It must contain numbers only.")
-    search_ID = int(args.search_ID)
+    for search_ID in args.search_ID:
+        if not search_ID.isdigit():
+            parser.error(f"Your identifier {search_ID} contains unrecognised characters. It must contain numbers only.")
+    search_IDs = list(dict.fromkeys(int(search_ID) for search_ID in args.search_ID))
+    thresholds = {'percent_single_copy': args.percent_single_copy,
+                  'TargetSpecies_Count': args.target_species_count,
+                  'TargetSpecies_Percentage': args.target_species_percentage}
     
     with open(args.species_file, 'r') as file:
         odb11v0_species = pd.read_csv(file, delimiter='\t', header=None, names=['NCBI_taxid', 'orthoDB_taxid', 'species', 'genome_id', 'genome_size', 'OG_count', 'coding'])
     taxid_to_species = dict(zip(odb11v0_species['orthoDB_taxid'].str.split('_').str[0], odb11v0_species['species']))
 
-    # Check if the temp_chunks directory exists
-    temp_dir = 'temp_chunks'
-    if os.path.exists(temp_dir):
-        print(f"Directory '{temp_dir}' already exists. Removing existing directory...")
-        # Remove the existing directory and its contents
-        shutil.rmtree(temp_dir)
-        print(f"Directory '{temp_dir}' removed.")
-
-    # Create a temporary directory for storing chunks
-    temp_dir = 'temp_chunks'
-    os.makedirs(temp_dir, exist_ok=True)
-
-    # Split the input file into chunks
-    chunk_size = 1000
-    with open(args.input_file, 'r') as input_file:
-        chunk_count = 0
-        chunk = []
-        for line in input_file:
-            if len(chunk) >= chunk_size:
-                with open(os.path.join(temp_dir, f'chunk_{chunk_count}.tsv'), 'w') as chunk_file:
-                    chunk_file.writelines(chunk)
-                chunk_count += 1
-                chunk = []
-            chunk.append(line)
-
-        # Write the remaining lines to the last chunk
-        with open(os.path.join(temp_dir, f'chunk_{chunk_count}.tsv'), 'w') as chunk_file:
-            chunk_file.writelines(chunk)
-        chunk_count += 1
-
-    # Process chunks in parallel
-    with ProcessPoolExecutor() as executor:
-        futures = []
-        for i in range(chunk_count):
-            input_chunk_file = os.path.join(temp_dir, f'chunk_{i}.tsv')
-            output_chunk_file = os.path.join(temp_dir, f'chunk_{i}_output.tsv')
-            future = executor.submit(process_file, input_chunk_file, search_ID, taxid_to_species, args.min_genomes_threshold, output_chunk_file, args.level2species_file)
-            futures.append(future)
-
-        # Wait for all tasks to complete
-        for future in futures:
-            try:
-                future.result()
-            except ValueError as e:
-                print(e)
-                sys.exit(1)  
-
-    # Combine the output chunks into the final result
-    with open(args.output_tsv, 'w', newline='') as final_output:
-        fieldnames = ['OG_ID', 'ProteinCount', 'SpeciesCount', 'nb_single_copy', 'percent_single_copy', 'ProteinID', 'taxids', 'species', 'gene_name', 'TargetSpecies_Count', 'TargetSpecies_Percentage']
-        writer = csv.DictWriter(final_output, fieldnames=fieldnames, delimiter='\t')
-        writer.writeheader()
-
-        for i in range(chunk_count):
-            output_chunk_file = os.path.join(temp_dir, f'chunk_{i}_output.tsv')
-            with open(output_chunk_file, 'r') as chunk_file:
-                for line in chunk_file:
-                    # Parse the line into a dictionary
-                    cog_dict = dict(zip(fieldnames, line.strip().split('\t')))
-                    # Write the dictionary to the CSV file
-                    writer.writerow(cog_dict)
-
-    # Clean up temporary directory
-    for i in range(chunk_count):
-        input_chunk_file = os.path.join(temp_dir, f'chunk_{i}.tsv')
-        output_chunk_file = os.path.join(temp_dir, f'chunk_{i}_output.tsv')
-        os.remove(input_chunk_file)
-        os.remove(output_chunk_file)
-
-    os.rmdir(temp_dir)
+    # Stream the input file to the worker processes and write the results of each clade in order
+    output_paths = {search_ID: output_path_for(args.output_tsv, search_ID, len(search_IDs)) for search_ID in search_IDs}
+    with ExitStack() as stack:
+        writers = {}
+        for search_ID, output_path in output_paths.items():
+            final_output = stack.enter_context(open(output_path, 'w', newline=''))
+            fieldnames = (SLIM_FIELDNAMES if args.slim else FIELDNAMES) + (COPY_NUMBER_FIELDNAMES if args.copy_numbers else [])
+            writers[search_ID] = [csv.DictWriter(final_output, fieldnames=fieldnames, delimiter='\t', extrasaction='ignore')]
+            if args.slim:
+                members_output = stack.enter_context(open_compressed(members_path(output_path), 'w'))
+                writers[search_ID].append(csv.DictWriter(members_output, fieldnames=MEMBER_FIELDNAMES, delimiter='\t', extrasaction='ignore'))
+            for writer in writers[search_ID]:
+                writer.writeheader()
+        try:
+            nb_written = process_batches(args.input_file, search_IDs, taxid_to_species, args.min_genomes_threshold, args.level2species_file, writers, thresholds=thresholds, copy_numbers=args.copy_numbers)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+
+    for search_ID, output_path in output_paths.items():
+        if nb_written[search_ID] == 0:
+            print(f'No COGs identified due to the min_genome_threshold for {search_ID}')
+        elif len(search_IDs) > 1:
+            print(f'{nb_written[search_ID]} OGs selected for {search_ID}: {output_path}')
+    if not any(nb_written.values()):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,99 +1,390 @@
 #!/usr/bin/env python3
 
 import concurrent.futures
-import subprocess
+import queue
+import threading
 import json
 import requests
 import csv
 import argparse
 import os
-import time
 import tempfile
 import shutil
+import sys
+from functools import partial
 
-def run_curl_command(protein_id):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'orthodb_utils'))
+from og_index import lookup_xref, og_names
+from og_results import og_results_fieldnames, read_og_results
+from http_client import ORTHODB_URL, ENA_URL, http_client, http_get
+from response_cache import OGDETAILS, ENA_FASTA, OG_GROUP, open_response_cache, cache_get, cache_put, close_response_cache
+from fasta_index import extract_fasta_records
+
+# Proteins queued per worker thread before the next OG is started (see main)
+PROTEINS_PER_WORKER = 16
+
+# Cache of the OrthoDB group metadata of the HTML report when no --cache is given
+REPORT_CACHE = 'rapport_OG_cache.sqlite'
+
+# Base URLs of the OrthoDB and ENA APIs (--orthodb_url and --ena_url, e.g. a local mock server)
+api_urls = {'orthodb': ORTHODB_URL, 'ena': ENA_URL}
+
+def fetch_ogdetails(client, protein_id, cache=None):
     """
-    Run the curl command to obtain information about the proteins in the OG.
+    Query the OrthoDB API for information about a protein of the OG.
     This retrieves the cds_id used to download the FASTA.
+    The answer is read from / saved to cache if one is given (see orthodb_utils/response_cache.py).
+    Returns the decoded JSON or None if the request failed (or the cache is offline and has no answer).
     """
-    curl_command = f"curl 'https://data.orthodb.org/current/ogdetails?id={protein_id}'"
-    result = subprocess.run(curl_command, shell=True, capture_output=True, text=True)
-    return result
+    if cache:
+        text = cache_get(cache, OGDETAILS, protein_id, versioned=True)
+        if text is not None:
+            return json.loads(text)
+        if cache['offline']:
+            return None
+    response = http_get(client, f"{api_urls['orthodb']}/current/ogdetails", params={'id': protein_id})
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    if cache:
+        cache_put(cache, OGDETAILS, protein_id, response.text, versioned=True)
+    return data
 
-def download_fasta_content(emblcds_id):
+def split_fasta_records(fasta_data):
+    """
+    Split a multi-record FASTA answered by the ENA API into its records.
+    Returns a dictionary accession -> record (header and sequence lines), each
+    record being reachable by the accessions of its header with and without
+    version (>ENA|AAK05452|AAK05452.1 ... -> AAK05452 and AAK05452.1).
+    """
+    records = {}
+    for chunk in ('\n' + fasta_data).split('\n>')[1:]:
+        lines = [line for line in chunk.split('\n') if line]
+        if not lines:
+            continue
+        record = '>' + '\n'.join(lines) + '\n'
+        fields = lines[0].split('|')
+        for field in fields[1:] if fields[0] == 'ENA' else fields:
+            if field.strip():
+                accession = field.split()[0]
+                records.setdefault(accession, record)
+                records.setdefault(accession.split('.')[0], record)
+    return records
+
+def download_fasta_batch(client, emblcds_ids):
+    """
+    Run one EBI API command to obtain the FASTA of several EMBLCDS ids (comma-separated).
+    Returns (dictionary emblcds_id -> FASTA record for the ids found in the
+    answer, or None if the request failed; HTTP code of the answer).
+    """
+    response = http_get(client, f"{api_urls['ena']}/fasta/{','.join(emblcds_ids)}")
+    if response.status_code != 200:
+        return None, response.status_code
+    records = split_fasta_records(response.text)
+    found = {}
+    for emblcds_id in emblcds_ids:
+        record = records.get(emblcds_id) or records.get(emblcds_id.split('.')[0])
+        if record:
+            found[emblcds_id] = record
+    return found, response.status_code
+
+def download_fasta_content(client, emblcds_ids):
     """
-    Run the EBI API command to obtain the FASTA.
+    Obtain the FASTA of a batch of EMBLCDS ids, retrying only the ids that failed:
+      - the ids missing from an answer are requested once more, together
+      - a request rejected by EBI (4xx code other than 429) is split in two
+        halves, down to single ids, so one rejected accession does not lose the others
+      - a request that could not be answered (connection error, timeout, 429
+        or 5xx code, already retried by http_get) fails for its whole batch,
+        which is tried again at the next run rather than split into more requests
+    Returns (dictionary emblcds_id -> FASTA record, set of the ids whose request
+    failed): the ids in neither are absent from the answers of EBI.
     """
-    fasta_url = f'https://www.ebi.ac.uk/ena/browser/api/fasta/{emblcds_id}'
-    response = requests.get(fasta_url)
-    return response.text if response.status_code == 200 else None
+    fastas = {}
+    failed = set()
+    pending = [(list(emblcds_ids), False)]
+    while pending:
+        batch, retried = pending.pop()
+        try:
+            found, status_code = download_fasta_batch(client, batch)
+        except requests.exceptions.RequestException:
+            found, status_code = None, None
+        if found is None:
+            rejected = status_code is not None and 400 <= status_code < 500 and status_code != 429
+            if rejected and len(batch) > 1:
+                middle = len(batch) // 2
+                pending.extend([(batch[:middle], retried), (batch[middle:], retried)])
+            else:
+                failed.update(batch)
+            continue
+        fastas.update(found)
+        missing = [emblcds_id for emblcds_id in batch if emblcds_id not in found]
+        if missing and not retried:
+            pending.append((missing, True))
+    return fastas, failed
+
+def find_emblcds_id(protein_id, log_info, client, og_index=None, cache=None):
+    """
+    Find the EMBLCDS reference of a protein: in the local OrthoDB index if one
+    is given and knows the protein, otherwise through the OrthoDB API.
+    Returns (EMBLCDS id or None, explaining why in log_info; True if OrthoDB
+    answered, False if the protein must be tried again at the next run).
+    """
+    if og_index:
+        emblcds_id = lookup_xref(og_index, protein_id)
+        if emblcds_id:
+            return emblcds_id, True
+
+    data = fetch_ogdetails(client, protein_id, cache)
+    if data is None:
+        if cache and cache['offline']:
+            log_info.append(f"For ID {protein_id}, no OrthoDB answer in the cache (offline).")
+        else:
+            log_info.append(f"For ID {protein_id}, the OrthoDB API did not answer.")
+        return None, False
+
+    if "xrefs" not in (data.get("data") or {}):
+        log_info.append(f"For ID {protein_id}, no 'xrefs' data found.")
+        return None, True
 
-def process_protein(protein_id):
+    emblcds_info = next((xref for xref in data["data"]["xrefs"] if xref.get("type") == "EMBLCDS"), None)
+    if not emblcds_info:
+        log_info.append(f"For ID {protein_id}, no 'EMBLCDS' ID found.")
+        return None, True
+    return emblcds_info["id"], True
+
+def process_protein(protein_id, client, og_index=None, cache=None):
     """
-    Process a single protein ID:
-      - Call OrthoDB (curl) to find its EMBLCDS reference
-      - Use the EMBLCDS to fetch the FASTA from EBI
-      - Build a FASTA-formatted string
-    Returns (fasta_string, log_information).
+    Find the EMBLCDS reference of a single protein ID (local OrthoDB index or OrthoDB API).
+    The requests go through client (see orthodb_utils/http_client.py), which
+    paces them per host, so no pause is needed here.
+    Returns (emblcds_id or None, log_information, True if OrthoDB answered).
     """
     try:
-        result = run_curl_command(protein_id)
-
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-
-            log_info = []
-            if "xrefs" in data["data"]:
-                emblcds_info = next((xref for xref in data["data"]["xrefs"] if xref.get("type") == "EMBLCDS"), None)
-
-                if emblcds_info:
-                    emblcds_id = emblcds_info["id"]
-                    log_info.append(f"For ID {protein_id}, 'EMBLCDS' ID is: {emblcds_id}")
-                    fasta_data = download_fasta_content(emblcds_id)
-
-                    if fasta_data:
-                        taxid = protein_id.split(':')[0].split('_')[0]
-                        species_info = fasta_data.split('\n')[0].split('|')[-1].strip()
-                        protein_fasta = f">{emblcds_id}| taxid={taxid}; {species_info}\n"
-                        protein_fasta += '\n'.join(fasta_data.split('\n')[1:])
-                        # 1-second pause to avoid API cancellation
-                        time.sleep(1)
-                        return protein_fasta, log_info
-                else:
-                    log_info.append(f"For ID {protein_id}, no 'EMBLCDS' ID found.")
-            else:
-                log_info.append(f"For ID {protein_id}, no 'xrefs' data found.")
-        return None, log_info
-    except requests.exceptions.SSLError as e:
-        error_message = ("requests.exceptions.SSLError: None: Max retries exceeded with url: "
+        log_info = []
+        emblcds_id, answered = find_emblcds_id(protein_id, log_info, client, og_index, cache)
+        if emblcds_id:
+            log_info.append(f"For ID {protein_id}, 'EMBLCDS' ID is: {emblcds_id}")
+        return emblcds_id, log_info, answered
+    except requests.exceptions.RequestException as e:
+        error_message = (f"For ID {protein_id}, {type(e).__name__}: {e}: "
                          "this error comes from the API, please try again")
-        return None, [error_message]
+        return None, [error_message], False
 
-def process_row(row, processed_ogs):
+def format_fasta(protein_id, emblcds_id, fasta_data):
     """
-    Process an entire row from the original TSV:
-      - Extract OG_ID
-      - Retrieve the FASTAs for each protein in that OG
-      - Write the FASTA and log files
-      - Count the number of sequences in the resulting FASTA file
-      - Return (og_id, num_sequences) or None if it fails
+    Build the FASTA-formatted string of a protein from the ENA record of its EMBLCDS id:
+    the header gives the EMBLCDS id, the taxid of the protein and the ENA description.
+    """
+    taxid = protein_id.split(':')[0].split('_')[0]
+    species_info = fasta_data.split('\n')[0].split('|')[-1].strip()
+    protein_fasta = f">{emblcds_id}| taxid={taxid}; {species_info}\n"
+    protein_fasta += '\n'.join(fasta_data.split('\n')[1:])
+    return protein_fasta
+
+def open_journal(journal_path):
+    """
+    Open the checkpoint journal of the run: a JSONL file with one line per
+    protein whose retrieval is over, {"protein_id", "og_id", "emblcds_id",
+    "fasta" (FASTA-formatted string or null), "log"}, appended as soon as it
+    is known. The lines of a previous run are loaded (a line cut by a crash
+    is ignored), so its proteins are not fetched again.
+    Returns a dictionary {'file', 'lock', 'entries' (protein_id -> line)}.
+    """
+    entries = {}
+    if os.path.isfile(journal_path):
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entries[entry['protein_id']] = entry
+    journal_file = open(journal_path, 'a')
+    # Complete a line cut by a crash, so the next line starts on its own
+    if journal_file.tell() > 0:
+        with open(journal_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                journal_file.write('\n')
+    return {'file': journal_file, 'lock': threading.Lock(), 'entries': entries}
+
+def journal_protein(journal, og_id, protein_id, emblcds_id, fasta, log_info):
+    """
+    Append the result of a protein to the journal (see open_journal) and flush it.
+    """
+    entry = {'protein_id': protein_id, 'og_id': og_id, 'emblcds_id': emblcds_id, 'fasta': fasta, 'log': log_info}
+    with journal['lock']:
+        journal['entries'][protein_id] = entry
+        journal['file'].write(json.dumps(entry) + '\n')
+        journal['file'].flush()
+
+def start_og(executor, row, done_queue, journal, client, og_index=None, batch_size=100, cache=None):
+    """
+    Start the retrieval of an OG on the shared executor, without waiting for it:
+      - the proteins already in the journal are not fetched again
+      - one task per other protein finds its EMBLCDS id (see process_protein)
+      - once they are all done, the FASTAs are read from cache or downloaded
+        from EBI, batch_size EMBLCDS ids per task (see fetch_og_fastas)
+    Each protein is journaled as soon as its FASTA is known. The OG (a
+    dictionary of its state) is put in done_queue when it is complete, to be
+    written by write_og_fasta, or as soon as one of its callbacks fails, with
+    the exception in og['error'] (see guard_og_callback).
     """
-    og_id = row['OG_ID']
     protein_ids = row['ProteinID'].split(';')
+    pending = [i for i, protein_id in enumerate(protein_ids) if protein_id not in journal['entries']]
+    og = {'og_id': row['OG_ID'], 'protein_ids': protein_ids, 'results': [None] * len(protein_ids),
+          'remaining': len(pending), 'failed': set(), 'lock': threading.Lock(), 'executor': executor,
+          'done_queue': done_queue, 'journal': journal, 'client': client, 'batch_size': batch_size, 'cache': cache}
+    if not pending:
+        done_queue.put(og)
+        return
+    for i in pending:
+        future = executor.submit(process_protein, protein_ids[i], client, og_index, cache)
+        future.add_done_callback(partial(guard_og_callback, og, protein_done, i))
+
+def guard_og_callback(og, callback, *args):
+    """
+    Run callback(og, *args), a done-callback of a task of og. concurrent.futures
+    only logs the exceptions of the callbacks, so og would never reach the writer
+    and the run would wait for it forever: if callback fails (e.g. the journal
+    or the cache cannot be written), og is put in done_queue with the exception
+    in og['error'], to be raised by the main thread. The later callbacks of a
+    failed og do nothing.
+    """
+    if 'error' in og:
+        return
+    try:
+        callback(og, *args)
+    except Exception as e:
+        with og['lock']:
+            first = 'error' not in og
+            og.setdefault('error', e)
+        if first:
+            og['done_queue'].put(og)
+
+def protein_done(og, i, future):
+    """
+    Callback of the task of the i-th protein of og: records its EMBLCDS id
+    (journaling the protein if OrthoDB has none for it), and starts the
+    download of the FASTAs once all the proteins of og are done.
+    """
+    protein_id = og['protein_ids'][i]
+    try:
+        og['results'][i] = future.result()
+    except Exception as e:
+        og['results'][i] = (None, [f"For ID {protein_id}, {type(e).__name__}: {e}"], False)
+    emblcds_id, log_info, answered = og['results'][i]
+    if emblcds_id is None and answered:
+        journal_protein(og['journal'], og['og_id'], protein_id, None, None, log_info)
+    with og['lock']:
+        og['remaining'] -= 1
+        last = og['remaining'] == 0
+    if last:
+        fetch_og_fastas(og)
+
+def journal_fastas(og, fastas, emblcds_ids):
+    """
+    Journal the proteins of og whose EMBLCDS id is in emblcds_ids, with their
+    FASTA if it is in fastas (none if EBI does not have it).
+    """
+    for i, result in enumerate(og['results']):
+        if result is None or result[0] not in emblcds_ids:
+            continue
+        protein_id = og['protein_ids'][i]
+        emblcds_id, log_info, _ = result
+        if emblcds_id in fastas:
+            fasta = format_fasta(protein_id, emblcds_id, fastas[emblcds_id])
+        else:
+            fasta = None
+            log_info = log_info + [f"For ID {protein_id}, no FASTA found at EBI for {emblcds_id}."]
+        journal_protein(og['journal'], og['og_id'], protein_id, emblcds_id, fasta, log_info)
 
+def fetch_og_fastas(og):
+    """
+    Read the FASTAs of the EMBLCDS ids of og from cache, and submit the download
+    of the others from EBI by batches (see batch_done).
+    """
+    # Each EMBLCDS id is downloaded once, even if several proteins share it, and only if it is not cached
+    emblcds_ids = list(dict.fromkeys(result[0] for result in og['results'] if result and result[0]))
+    cache = og['cache']
+    if cache:
+        cached = {}
+        for emblcds_id in emblcds_ids:
+            record = cache_get(cache, ENA_FASTA, emblcds_id)
+            if record is not None:
+                cached[emblcds_id] = record
+        journal_fastas(og, cached, set(cached))
+        emblcds_ids = [emblcds_id for emblcds_id in emblcds_ids if emblcds_id not in cached]
+        if cache['offline']:
+            og['failed'].update(emblcds_ids)
+            emblcds_ids = []
+    batches = [emblcds_ids[i:i + og['batch_size']] for i in range(0, len(emblcds_ids), og['batch_size'])]
+    if not batches:
+        og['done_queue'].put(og)
+        return
+    og['remaining'] = len(batches)
+    for batch in batches:
+        future = og['executor'].submit(download_fasta_content, og['client'], batch)
+        future.add_done_callback(partial(guard_og_callback, og, batch_done, batch))
+
+def batch_done(og, batch, future):
+    """
+    Callback of a FASTA download task of og: caches and journals the FASTAs
+    found, and hands og to the writer once all its batches are done.
+    The ids whose request failed are not journaled, so they are tried again at the next run.
+    """
+    try:
+        found, failed = future.result()
+    except Exception:
+        found, failed = {}, set(batch)
+    if og['cache']:
+        for emblcds_id, record in found.items():
+            cache_put(og['cache'], ENA_FASTA, emblcds_id, record)
+    journal_fastas(og, found, set(batch) - failed)
+    with og['lock']:
+        og['failed'].update(failed)
+        og['remaining'] -= 1
+        last = og['remaining'] == 0
+    if last:
+        og['done_queue'].put(og)
+
+def write_og_fasta(og):
+    """
+    Write the FASTA and log files of a completed OG (see start_og) from the
+    journal, which holds the proteins of this run and of the previous ones.
+    Returns (og_id, num_sequences) or None if no FASTA was found (see write_fasta_files).
+    """
+    entries = og['journal']['entries']
+    fastas = []
+    logs = []
+    for protein_id, result in zip(og['protein_ids'], og['results']):
+        entry = entries.get(protein_id)
+        if entry is not None:
+            fastas.append(entry['fasta'])
+            logs.append(entry['log'])
+        else:
+            emblcds_id, log_info, _ = result
+            if emblcds_id in og['failed']:
+                log_info = log_info + [f"For ID {protein_id}, the FASTA of {emblcds_id} could not be downloaded, it will be tried again at the next run."]
+            logs.append(log_info)
+    return write_fasta_files(og['og_id'], fastas, logs)
+
+def write_fasta_files(og_id, fastas, logs):
+    """
+    Write the FASTA file of an OG (the FASTA-formatted strings of fastas, None
+    for the proteins without FASTA) and its log file (logs: one list of lines per protein):
+      - Count the number of sequences in the resulting FASTA file
+      - Return (og_id, num_sequences) or None if no FASTA was found
+    """
     log_filename = f'{og_id}_log.txt'
     fasta_filename = f'{og_id}_fasta.fa'
 
-    if og_id in processed_ogs:
-        return None
-
     # Use a temporary file for writing FASTA content.
     with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_fasta_file:
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            results = list(executor.map(process_protein, protein_ids))
-        for fasta_data, _ in results:
-            if fasta_data:
-                temp_fasta_file.write(fasta_data)
+        for fasta in fastas:
+            if fasta:
+                temp_fasta_file.write(fasta)
 
     # If the content has been written successfully, rename the temp file to the final file.
     if os.path.isfile(temp_fasta_file.name) and os.path.getsize(temp_fasta_file.name) > 0:
@@ -101,19 +392,104 @@ def process_row(row, processed_ogs):
     else:
         # If the temp file is empty or wasn't created, remove it
         os.remove(temp_fasta_file.name)
-        # Add OG to processed set to avoid re-processing
-        processed_ogs.add(og_id)
         return None
 
     # Write the log file
     with open(log_filename, 'w') as log_file:
-        for _, log_info in results:
+        for log_info in logs:
             log_file.write('\n'.join(log_info) + '\n')
 
     # Count how many sequences in the resulting FASTA
     num_sequences = count_sequences_in_fasta(fasta_filename)
     return og_id, num_sequences
 
+def format_local_fasta(protein_id, record):
+    """
+    Build the FASTA-formatted string of a protein from its record in a bulk
+    OrthoDB FASTA file, with the same header layout as format_fasta: the gene id,
+    the taxid of the protein and the description of the OrthoDB header.
+    """
+    header, _, sequence = record.partition('\n')
+    taxid = protein_id.split(':')[0].split('_')[0]
+    fields = header[1:].split(None, 1)
+    description = fields[1].strip() if len(fields) > 1 else ''
+    protein_fasta = f">{protein_id}| taxid={taxid}; {description}\n"
+    protein_fasta += sequence if not sequence or sequence.endswith('\n') else sequence + '\n'
+    return protein_fasta
+
+def recover_local_fastas(rows, cds_fasta):
+    """
+    Write the FASTA and log files of the OGs of rows from a bulk OrthoDB FASTA
+    file (cds_fasta) instead of the APIs: the records of the proteins of all
+    the OGs are read at once, in one pass over the file (see orthodb_utils/fasta_index.py).
+    Returns {og_id: num_sequences} for the OGs with at least one FASTA.
+    """
+    protein_ids_per_og = {row['OG_ID']: row['ProteinID'].split(';') for row in rows}
+    records = extract_fasta_records(cds_fasta, {protein_id for protein_ids in protein_ids_per_og.values() for protein_id in protein_ids})
+    num_sequences_per_og = {}
+    for og_id, protein_ids in protein_ids_per_og.items():
+        fastas = []
+        logs = []
+        for protein_id in protein_ids:
+            if protein_id in records:
+                fastas.append(format_local_fasta(protein_id, records[protein_id]))
+                logs.append([f"For ID {protein_id}, sequence read from {cds_fasta}"])
+            else:
+                fastas.append(None)
+                logs.append([f"For ID {protein_id}, no sequence found in {cds_fasta}."])
+        result = write_fasta_files(og_id, fastas, logs)
+        if result is not None:
+            num_sequences_per_og[og_id] = result[1]
+    return num_sequences_per_og
+
+def recover_fastas(og_rows, new_rows, client, cache, args):
+    """
+    Write the FASTA and log files of the OGs of og_rows (appended to new_rows
+    as they are read) from the OrthoDB and EBI APIs.
+    Returns {og_id: num_sequences} for the OGs with at least one FASTA.
+    """
+    # Proteins fetched by the previous runs (see open_journal): only the others are fetched,
+    # and the FASTAs and counts of all the OGs are rebuilt from the journal
+    journal = open_journal(args.journal)
+    print(f"{len(journal['entries'])} proteins already fetched in {args.journal}")
+
+    # The proteins of all the OGs go through one pool of threads; at most --workers OGs
+    # and PROTEINS_PER_WORKER * --workers of their proteins are in progress, so the
+    # downloads of a complete OG are not queued behind the proteins of many others,
+    # and each OG is written as soon as it is complete.
+    num_sequences_per_og = {}
+    done_queue = queue.Queue()
+    in_progress = {'ogs': 0, 'proteins': 0}
+
+    def write_next_og():
+        og = done_queue.get()
+        if 'error' in og:
+            # Do not start the tasks still queued, and stop the run as the sequential version did
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise og['error']
+        in_progress['ogs'] -= 1
+        in_progress['proteins'] -= len(og['protein_ids'])
+        result = write_og_fasta(og)
+        if result is not None:
+            og_id, num_sequences = result
+            num_sequences_per_og[og_id] = num_sequences
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+            for row in og_rows:
+                new_rows.append(row)
+                start_og(executor, row, done_queue, journal, client, args.og_index, args.ena_batch_size, cache)
+                in_progress['ogs'] += 1
+                in_progress['proteins'] += row['ProteinID'].count(';') + 1
+                while (in_progress['ogs'] >= args.workers or in_progress['proteins'] >= PROTEINS_PER_WORKER * args.workers
+                       or not done_queue.empty()):
+                    write_next_og()
+            while in_progress['ogs']:
+                write_next_og()
+    finally:
+        journal['file'].close()
+    return num_sequences_per_og
+
 def count_sequences_in_fasta(fasta_filename):
     """
     Count the number of sequences in a FASTA file.
@@ -122,14 +498,13 @@ def count_sequences_in_fasta(fasta_filename):
         return sum(1 for line in fasta_file if line.startswith('>'))
 
 
-def fetch_orthodb_data(og_id):
+def fetch_orthodb_data(client, og_id):
     """
     Retrieves JSON information for a given OG_ID from the OrthoDB (v12) API.
     Returns a Python dictionary (or None if there's an error).
     """
-    url = f"https://data.orthodb.org/v12/group?id={og_id}"
     try:
-        resp = requests.get(url, timeout=10)
+        resp = http_get(client, f"{api_urls['orthodb']}/v12/group", params={'id': og_id})
         if resp.status_code == 200:
             return resp.json().get("data", {})
         else:
@@ -139,6 +514,29 @@ def fetch_orthodb_data(og_id):
         print(f"Exception while fetching JSON for {og_id}: {e}")
         return None
 
+def fetch_og_metadata(og_ids, client, cache, max_workers=8, offline=False):
+    """
+    Returns {og_id: OrthoDB group metadata (see fetch_orthodb_data)} for og_ids:
+    read from cache, the others are fetched concurrently by max_workers threads
+    (unless offline) and stored in cache, so the report can be built again
+    without network.
+    """
+    metadata = {}
+    missing = []
+    for og_id in og_ids:
+        text = cache_get(cache, OG_GROUP, og_id, versioned=True)
+        if text is not None:
+            metadata[og_id] = json.loads(text)
+        else:
+            missing.append(og_id)
+    if missing and not offline:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for og_id, json_data in zip(missing, executor.map(partial(fetch_orthodb_data, client), missing)):
+                if json_data:
+                    cache_put(cache, OG_GROUP, og_id, json.dumps(json_data), versioned=True)
+                    metadata[og_id] = json_data
+    return metadata
+
 def create_html_tabs(data_per_og):
     """
     Receives a dictionary data_per_og = { og_id: { 'tsv_row': {...}, 'json_data': {...} }, ... }
@@ -385,47 +783,79 @@ def main():
       1) Reads an input TSV (OG_ID, ProteinID, etc.)
       2) For each OG, retrieves FASTAs using OrthoDB + EMBL API
       3) Updates the TSV with a new 'NumberOfSeq' column
-      4) Generates an HTML report from the updated TSV
+      4) Generates an HTML report from the updated TSV (alone with --report_only)
     """
     parser = argparse.ArgumentParser(
         description='retrieves nucleic FASTAs for each OG and generates an HTML report.',
         epilog="Example: python fastas_recovery.py OG_selected_1760.tab"
     )
-    parser.add_argument('filename', help='TSV file containing OG selected information (step 2).')
+    parser.add_argument('filename', help='TSV file containing OG selected information (step 2). A slim table (--slim of step 1) is read with its members table.')
+    parser.add_argument('--og_index', help='local OrthoDB index built by orthodb_utils/og_index.py: the EMBLCDS ids it contains are used without calling the OrthoDB API, and its OG names complete the HTML report when the API is unavailable.')
+    parser.add_argument('--cds_fasta', help='bulk FASTA file of OrthoDB with the nucleotide sequences of the CDS (e.g. odb11v0_cds_fasta): the sequences are read from it instead of the APIs. A plain file is indexed by gene id at its first use (see orthodb_utils/fasta_index.py), a compressed file is scanned once.')
+    parser.add_argument('--report_only', action='store_true', help=f'only generates the HTML report from filename, a table already updated by this script (updated_*): the OrthoDB group metadata is read from --cache (or {REPORT_CACHE}), only the missing OGs are fetched.')
+    parser.add_argument('--journal', default='fastas_recovery_journal.jsonl', help='checkpoint journal of the fetched proteins (default: fastas_recovery_journal.jsonl): a new run only fetches the proteins missing from it.')
+    parser.add_argument('--workers', type=int, default=8, help='number of threads fetching the proteins of all the OGs from one shared queue (default: 8).')
+    parser.add_argument('--concurrency', type=int, default=4, help='maximum number of requests in flight per API host (default: 4).')
+    parser.add_argument('--rate', type=float, default=5.0, help='maximum number of requests per second per API host, 0 for no limit (default: 5).')
+    parser.add_argument('--ena_batch_size', type=int, default=100, help='number of EMBLCDS ids per request to the ENA API (default: 100).')
+    parser.add_argument('--retries', type=int, default=3, help='number of retries of a request failing with a connection error, a timeout, HTTP 429 or 5xx (default: 3).')
+    parser.add_argument('--cache', help='SQLite cache of the OrthoDB and ENA answers (created if missing, see orthodb_utils/response_cache.py): cached proteins and EMBLCDS ids are not downloaded again.')
+    parser.add_argument('--cache_release', help='OrthoDB release of the run (e.g. odb12): cached OrthoDB answers of another release are downloaded again.')
+    parser.add_argument('--cache_ttl', type=float, help='age in days after which a cached answer is downloaded again (default: never).')
+    parser.add_argument('--cache_max_size', type=float, help='size in MB the cache is trimmed to at the end of the run, least recently used answers first (default: no limit).')
+    parser.add_argument('--offline', action='store_true', help='no network: only the answers of --cache (and of --og_index), or the sequences of --cds_fasta, are used.')
+    parser.add_argument('--orthodb_url', default=ORTHODB_URL, help=f'base URL of the OrthoDB API (default: {ORTHODB_URL}).')
+    parser.add_argument('--ena_url', default=ENA_URL, help=f'base URL of the ENA browser API (default: {ENA_URL}).')
     args = parser.parse_args()
 
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.ena_batch_size < 1:
+        parser.error("--ena_batch_size must be at least 1")
+    if args.offline and not (args.cache or args.cds_fasta or args.report_only):
+        parser.error("--offline needs --cache, --cds_fasta or --report_only")
+
     if not os.path.isfile(args.filename):
         print(f"File {args.filename} does not exist.")
         return
 
     # --- 1) FASTA retrieval process and updating the TSV with 'NumberOfSeq' ---
 
-    processed_ogs = set()
-
-    # Check which OGs have logs (to avoid re-processing)
-    for filename in os.listdir('.'):
-        if filename.endswith('_log.txt'):
-            processed_ogs.add(filename.split('_')[0])
-
-    # We'll build an updated version of the input TSV
-    new_rows = []
-    with open(args.filename, 'r') as og_file:
-        og_reader = csv.DictReader(og_file, delimiter='\t')
-        for row in og_reader:
-            result = process_row(row, processed_ogs)
-            if result is not None:
-                og_id, num_sequences = result
-                row['NumberOfSeq'] = num_sequences
-            new_rows.append(row)
-
-    updated_filename = f'updated_{os.path.basename(args.filename)}'
-    with open(updated_filename, 'w', newline='') as output_file:
-        fieldnames = og_reader.fieldnames + ['NumberOfSeq']
-        writer = csv.DictWriter(output_file, fieldnames=fieldnames, delimiter='\t')
-        writer.writeheader()
-        writer.writerows(new_rows)
-
-    print(f"Updated TSV generated: {updated_filename}")
+    # One pooled HTTP client (kept-alive connections, per-host concurrency and rate limits) for all the requests
+    api_urls['orthodb'] = args.orthodb_url.rstrip('/')
+    api_urls['ena'] = args.ena_url.rstrip('/')
+    client = http_client(args.concurrency, args.rate, args.retries)
+    cache = open_response_cache(args.cache, args.cache_release, args.cache_ttl, args.cache_max_size, args.offline) if args.cache else None
+
+    if args.report_only:
+        updated_filename = args.filename
+    else:
+        # We'll build an updated version of the input TSV
+        # (for a slim table, the ProteinID column is read from its members table, see orthodb_utils/og_results.py)
+        new_rows = []
+        fieldnames = og_results_fieldnames(args.filename)
+        og_rows = read_og_results(args.filename, fieldnames + ['ProteinID'] if 'ProteinID' not in fieldnames else fieldnames)
+        if args.cds_fasta:
+            # Local mode: the sequences are read from the bulk OrthoDB file, without the APIs
+            new_rows = list(og_rows)
+            num_sequences_per_og = recover_local_fastas(new_rows, args.cds_fasta)
+        else:
+            num_sequences_per_og = recover_fastas(og_rows, new_rows, client, cache, args)
+
+        for row in new_rows:
+            if row['OG_ID'] in num_sequences_per_og:
+                row['NumberOfSeq'] = num_sequences_per_og[row['OG_ID']]
+
+        updated_filename = f'updated_{os.path.basename(args.filename)}'
+        with open(updated_filename, 'w', newline='') as output_file:
+            fieldnames = fieldnames + ['NumberOfSeq']
+            writer = csv.DictWriter(output_file, fieldnames=fieldnames, delimiter='\t', extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(new_rows)
+
+        print(f"Updated TSV generated: {updated_filename}")
 
     # --- 2) Generate the HTML from the updated TSV ---
 
@@ -440,11 +870,19 @@ def main():
                 "json_data": {}
             }
 
-    # Fetch OrthoDB data for each OG_ID
+    # Fetch OrthoDB data for each OG_ID, concurrently, through the cache
+    # (the cache of --cache, or REPORT_CACHE next to the report)
+    report_cache = cache or open_response_cache(REPORT_CACHE, args.cache_release, args.cache_ttl)
+    metadata = fetch_og_metadata(data_per_og, client, report_cache, args.workers, args.offline)
+    if report_cache is not cache:
+        close_response_cache(report_cache)
+    local_names = og_names(args.og_index, data_per_og) if args.og_index else {}
     for og_id in data_per_og:
-        json_data = fetch_orthodb_data(og_id)
+        json_data = metadata.get(og_id)
         if json_data:
             data_per_og[og_id]["json_data"] = json_data
+        elif og_id in local_names:
+            data_per_og[og_id]["json_data"] = {"name": local_names[og_id]}
         else:
             data_per_og[og_id]["json_data"] = {}
 
@@ -456,5 +894,9 @@ def main():
 
     print(f"HTML file generated: {output_html}")
 
+    if cache:
+        print(f"Cache {args.cache}: {cache['hits']} answers reused, {cache['misses']} missing")
+        close_response_cache(cache)
+
 if __name__ == "__main__":
     main()
@@ -267,20 +267,15 @@ def read_og_info(og_file):
     }
     """
     og_info = {}
+    # Columns are found by name, so the full and the slim (--slim) tables of STEP1 are both read,
+    # and only the needed columns are kept
     with open(og_file, 'r') as og_file:
-        next(og_file)  # Skip header
-        for line in og_file:
-            columns = line.strip().split('\t')
-            og_id = columns[0]
-            species_count = columns[9]
-            percent_single_copy = columns[4]
-            gene_name = columns[8]
-            number_of_seq = columns[11]
-            og_info[og_id] = {
-                "NumberOfSeq": number_of_seq,
-                "SpeciesCount": species_count,
-                "percent_single_copy": percent_single_copy,
-                "gene_name": gene_name
+        for row in csv.DictReader(og_file, delimiter='\t'):
+            og_info[row['OG_ID']] = {
+                "NumberOfSeq": row['NumberOfSeq'],
+                "SpeciesCount": row['TargetSpecies_Count'],
+                "percent_single_copy": row['percent_single_copy'],
+                "gene_name": row['gene_name']
             }
     return og_info
 
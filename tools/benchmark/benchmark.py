@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+__author__ = 'Gabryelle Agoutin - INRAE'
+__copyright__ = 'Copyright (C) 2024 INRAE'
+__license__ = 'GNU General Public License'
+__version__ = '1.0'
+__email__ = 'gabryelle.agoutin@inrae.fr'
+__status__ = 'prod'
+
+
+import os
+import sys
+import time
+import argparse
+import datetime
+import subprocess
+
+from synthetic_orthodb import generate_orthodb
+
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+STEP0_SCRIPT = os.path.join(TOOLS_DIR, '0_File_bacterian_OG', 'script_formatting_file_bacterian_OG', 'formatting_bacterial_orthologue_file.py')
+STEP1_SCRIPT = os.path.join(TOOLS_DIR, 'STEP1_GENES_SELECTION', '1_search_taxid_and_monocopy_calculation', 'search_taxid_and_monocopy_and_percentage_calculation.py')
+OG_STORE_SCRIPT = os.path.join(TOOLS_DIR, 'orthodb_utils', 'og_store.py')
+
+STAGES = ['step0', 'og_store', 'step1_text', 'step1_store']
+
+REPORT_FIELDS = ['date', 'commit', 'stage', 'seconds', 'peak_rss_MB', 'input_MB', 'MB_per_s', 'items', 'items_per_s', 'unit']
+
+##################################################################################################################################################
+#
+# FUNCTIONS
+#
+##################################################################################################################################################
+
+def count_lines(path, skip_header=False):
+    '''
+    Returns the number of lines of path (without its header if skip_header).
+    '''
+    with open(path, 'rb') as f:
+        nb_lines = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+    return max(0, nb_lines - 1) if skip_header else nb_lines
+
+def run_stage(command, log_path):
+    '''
+    Runs command (a list) with its output in log_path.
+
+    Returns:
+        (seconds, peak RSS in MB): wall time of the command and maximum resident
+            memory of its largest process (worker processes included, as they
+            are waited for by the command).
+    '''
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed (exit code {process.returncode}), see {log_path}")
+    # ru_maxrss is in kilobytes on Linux
+    return seconds, usage.ru_maxrss / 1024
+
+def stage_commands(stage, data_dir, work_dir, search_IDs, threads):
+    '''
+    Returns (command, input path, number of input items, unit of the items) of a stage.
+    '''
+    og2genes = os.path.join(data_dir, 'odb11v0_OG2genes.tab')
+    level2species = os.path.join(data_dir, 'odb11v0_level2species.tab')
+    og_table = os.path.join(work_dir, 'Bacterial_OG.tab')
+    og_store = os.path.join(work_dir, 'Bacterial_OG.store')
+    step1 = [sys.executable, STEP1_SCRIPT, '-f', os.path.join(data_dir, 'odb11v0_species.tab'), '-l', level2species,
+             '-s'] + [str(search_ID) for search_ID in search_IDs]
+
+    if stage == 'step0':
+        command = [sys.executable, STEP0_SCRIPT, '--streaming', '-o', og2genes, '-s', level2species,
+                   '-g', os.path.join(data_dir, 'odb11v0_OGs.tab'), '-f', og_table, '-t', str(threads)]
+        return command, og2genes, lambda: count_lines(og2genes), 'genes'
+    if stage == 'og_store':
+        return [sys.executable, OG_STORE_SCRIPT, '-i', og_table, '-o', og_store], og_table, lambda: count_lines(og_table, True), 'OGs'
+    if stage == 'step1_text':
+        command = step1 + ['-i', og_table, '-o', os.path.join(work_dir, 'OG_text_{search_ID}.tab')]
+        return command, og_table, lambda: count_lines(og_table, True), 'OGs'
+    command = step1 + ['-i', og_store, '-o', os.path.join(work_dir, 'OG_store_{search_ID}.tab')]
+    return command, og_table, lambda: count_lines(og_table, True), 'OGs'
+
+def input_size(path):
+    '''
+    Returns the size of path in MB (a directory: the total size of its files).
+    '''
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1e6
+    return os.path.getsize(path) / 1e6
+
+def current_commit():
+    '''
+    Returns the short hash of the git commit of the scripts, or '' outside a git repository.
+    '''
+    try:
+        result = subprocess.run(['git', '-C', TOOLS_DIR, 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True)
+    except OSError:
+        return ''
+    return result.stdout.strip() if result.returncode == 0 else ''
+
+def run_benchmark(data_dir, work_dir, stages, search_IDs, threads=1):
+    '''
+    Runs the stages in order on the OrthoDB tables of data_dir, writing
+    their outputs in work_dir.
+
+    Returns:
+        list of dict (see REPORT_FIELDS), one per stage.
+    '''
+    os.makedirs(work_dir, exist_ok=True)
+    date = datetime.datetime.now().isoformat(timespec='seconds')
+    commit = current_commit()
+    results = []
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        command, input_path, items, unit = stage_commands(stage, data_dir, work_dir, search_IDs, threads)
+        seconds, peak_rss = run_stage(command, os.path.join(work_dir, f'{stage}.log'))
+        size = input_size(input_path)
+        nb_items = items()
+        results.append({'date': date, 'commit': commit, 'stage': stage, 'seconds': round(seconds, 3),
+                        'peak_rss_MB': round(peak_rss, 1), 'input_MB': round(size, 2),
+                        'MB_per_s': round(size / seconds, 2), 'items': nb_items,
+                        'items_per_s': round(nb_items / seconds), 'unit': unit})
+        print(f"{stage}\t{seconds:.2f} s\t{peak_rss:.0f} MB\t{size / seconds:.1f} MB/s\t{nb_items / seconds:.0f} {unit}/s")
+    return results
+
+def write_report(results, report_path):
+    '''
+    Appends the results to the tab-separated report_path (with a header if it is new),
+    so successive runs can be compared.
+    '''
+    new_report = not os.path.isfile(report_path)
+    with open(report_path, 'a') as report:
+        if new_report:
+            report.write('\t'.join(REPORT_FIELDS) + '\n')
+        for result in results:
+            report.write('\t'.join(str(result[field]) for field in REPORT_FIELDS) + '\n')
+
+##################################################################################################################################################
+#
+# MAIN
+#
+##################################################################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measures the wall time, peak memory and throughput of STEP0 (formatting_bacterial_orthologue_file.py), of the export \
+                     to an OG store and of STEP1 (search_taxid_and_monocopy_and_percentage_calculation.py, on the text table and on the store), \
+                     on a synthetic OrthoDB release generated by synthetic_orthodb.py if the data directory does not contain one.",
+        epilog="Exemple: python benchmark.py -d synthetic_orthodb -w benchmark_work --nb_og 100000 --nb_species 2000 -s 2 -r benchmark_report.tab")
+    parser.add_argument('-d','--data_dir', dest="data_dir", help="INPUT: directory of the OrthoDB tables (odb11v0_OG2genes.tab, odb11v0_OGs.tab, \
+                        odb11v0_level2species.tab, odb11v0_species.tab), generated if odb11v0_OG2genes.tab is missing", required=True)
+    parser.add_argument('-w','--work_dir', dest="work_dir", default='benchmark_work', help="OUTPUT: directory of the outputs and logs of the stages (default: benchmark_work)")
+    parser.add_argument('-r','--report', dest="report", help="OUTPUT (optional): tab-separated report the results are appended to")
+    parser.add_argument('-s','--search_ID', nargs='+', type=int, default=[2], help="clades searched by STEP1 (default: 2)")
+    parser.add_argument('-t','--threads', type=int, default=1, help="number of processes of STEP0 (default: 1)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help="stages to run, in this order (default: all)")
+    parser.add_argument('--nb_og', type=int, default=10000, help="number of OGs of the generated release (default: 10000)")
+    parser.add_argument('--nb_species', type=int, default=1000, help="number of species of the generated release (default: 1000)")
+    parser.add_argument('--paralog_rate', type=float, default=0.1, help="paralog rate of the generated release (default: 0.1)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the generated release (default: 0)")
+    args = parser.parse_args()
+
+    try:
+        if not os.path.isfile(os.path.join(args.data_dir, 'odb11v0_OG2genes.tab')):
+            start = time.perf_counter()
+            generate_orthodb(args.data_dir, args.nb_og, args.nb_species, args.paralog_rate, seed=args.seed)
+            print(f"generation\t{time.perf_counter() - start:.2f} s")
+        results = run_benchmark(args.data_dir, args.work_dir, args.stages, args.search_ID, args.threads)
+        if args.report:
+            write_report(results, args.report)
+            print("Finished. The benchmark report is here :", args.report)
+    except Exception as e:
+        print(f"an error has occured : {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+__author__ = 'Gabryelle Agoutin - INRAE'
+__copyright__ = 'Copyright (C) 2024 INRAE'
+__license__ = 'GNU General Public License'
+__version__ = '1.0'
+__email__ = 'gabryelle.agoutin@inrae.fr'
+__status__ = 'prod'
+
+
+import os
+import sys
+import random
+import argparse
+
+
+# Taxids of the synthetic taxonomy: Bacteria (2) and Archaea (2157) contain phyla, which contain genera
+BACTERIA = 2
+ARCHAEA = 2157
+FIRST_PHYLUM = 100000
+FIRST_GENUS = 200000
+FIRST_SPECIES = 1000000
+
+##################################################################################################################################################
+#
+# FUNCTIONS
+#
+##################################################################################################################################################
+
+def build_taxonomy(nb_species, nb_phyla, nb_genera, archaea_fraction, rng):
+    '''
+    Builds a random taxonomy of nb_species species.
+
+    Returns:
+        dict: genus -> (kingdom, phylum, list of OrthoDB species identifiers, e.g. 1000000_0).
+            The genera are spread over nb_phyla phyla (at least one of Archaea
+            if archaea_fraction > 0), the species over the genera.
+    '''
+    nb_archaea_phyla = max(1, round(nb_phyla * archaea_fraction)) if archaea_fraction > 0 else 0
+    nb_archaea_phyla = min(nb_archaea_phyla, nb_phyla - 1)
+    phyla = [(ARCHAEA if p < nb_archaea_phyla else BACTERIA, FIRST_PHYLUM + p) for p in range(nb_phyla)]
+
+    genera = {}
+    for g in range(nb_genera):
+        kingdom, phylum = phyla[g % nb_phyla]
+        genera[FIRST_GENUS + g] = (kingdom, phylum, [])
+    genus_ids = list(genera)
+    for s in range(nb_species):
+        genus = genus_ids[s % len(genus_ids)] if s < len(genus_ids) else rng.choice(genus_ids)
+        genera[genus][2].append(f"{FIRST_SPECIES + s}_0")
+    return genera
+
+def write_taxonomy(genera, output_dir):
+    '''
+    Writes odb11v0_level2species.tab, odb11v0_species.tab and odb11v0_levels.tab for the taxonomy of build_taxonomy.
+    '''
+    species_by_level = {}
+    with open(os.path.join(output_dir, 'odb11v0_level2species.tab'), 'w') as level2species, \
+         open(os.path.join(output_dir, 'odb11v0_species.tab'), 'w') as species_tab:
+        for genus, (kingdom, phylum, species_ids) in genera.items():
+            for species_id in species_ids:
+                level2species.write(f"{kingdom}\t{species_id}\t3\t{{{kingdom},{phylum},{genus}}}\n")
+                taxid = species_id.split('_')[0]
+                species_tab.write(f"{taxid}\t{species_id}\tSpecies {taxid}\tGCA_{taxid}.1\t3000000\t2500\tC\n")
+                for level in (kingdom, phylum, genus):
+                    species_by_level[level] = species_by_level.get(level, 0) + 1
+
+    names = {BACTERIA: 'Bacteria', ARCHAEA: 'Archaea'}
+    with open(os.path.join(output_dir, 'odb11v0_levels.tab'), 'w') as levels:
+        for level, nb_species in sorted(species_by_level.items()):
+            name = names.get(level) or (f"Phylum {level}" if level < FIRST_GENUS else f"Genus {level}")
+            levels.write(f"{level}\t{name}\t0\t0\t{nb_species}\n")
+
+def write_orthogroups(genera, output_dir, nb_og, mean_og_species, paralog_rate, rng):
+    '''
+    Writes odb11v0_OG2genes.tab and odb11v0_OGs.tab with nb_og OGs.
+
+    Each OG is defined at the level of a kingdom, a phylum or a genus and
+    contains a random subset of its species (mean_og_species on average).
+    Each species has one copy of the gene, plus one more copy with
+    probability paralog_rate for each copy (geometric number of paralogs).
+    The lines of an OG are contiguous, as in the files distributed by OrthoDB.
+
+    Returns:
+        (number of OGs, number of genes) written.
+    '''
+    # Only the levels having species can have OGs
+    species_by_level = {}
+    for genus, (kingdom, phylum, species_ids) in genera.items():
+        if species_ids:
+            for level in (kingdom, phylum, genus):
+                species_by_level.setdefault(level, []).extend(species_ids)
+    kingdoms = [level for level in (BACTERIA, ARCHAEA) if level in species_by_level]
+    phyla = sorted({phylum for _, phylum, species_ids in genera.values() if species_ids})
+    genus_ids = [genus for genus, (_, _, species_ids) in genera.items() if species_ids]
+
+    next_gene = {}
+    nb_genes = 0
+    with open(os.path.join(output_dir, 'odb11v0_OG2genes.tab'), 'w') as og2genes, \
+         open(os.path.join(output_dir, 'odb11v0_OGs.tab'), 'w') as ogs:
+        for i in range(nb_og):
+            draw = rng.random()
+            level = rng.choice(kingdoms) if draw < 0.3 else rng.choice(phyla) if draw < 0.7 else rng.choice(genus_ids)
+            candidates = species_by_level[level]
+            size = min(len(candidates), max(1, int(rng.expovariate(1 / mean_og_species)) + 1))
+            OG_id = f"{i}at{level}"
+            ogs.write(f"{OG_id}\t{level}\tsynthetic gene {i}\n")
+            lines = []
+            for species_id in rng.sample(candidates, size):
+                copies = 1
+                while rng.random() < paralog_rate:
+                    copies += 1
+                for _ in range(copies):
+                    gene = next_gene.get(species_id, 0)
+                    next_gene[species_id] = gene + 1
+                    lines.append(f"{OG_id}\t{species_id}:{gene:06x}\n")
+            rng.shuffle(lines)
+            og2genes.writelines(lines)
+            nb_genes += len(lines)
+    return nb_og, nb_genes
+
+def generate_orthodb(output_dir, nb_og, nb_species, paralog_rate=0.1, mean_og_species=20, nb_phyla=10, nb_genera=100,
+                     archaea_fraction=0.1, seed=0):
+    '''
+    Writes a synthetic OrthoDB release in output_dir: odb11v0_OG2genes.tab,
+    odb11v0_OGs.tab, odb11v0_level2species.tab, odb11v0_species.tab and
+    odb11v0_levels.tab, in the formats of OrthoDB, so they can be given to
+    formatting_bacterial_orthologue_file.py and to
+    search_taxid_and_monocopy_and_percentage_calculation.py. The same seed
+    gives the same files.
+    '''
+    if nb_genera < nb_phyla:
+        raise ValueError("there must be at least as many genera as phyla")
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    genera = build_taxonomy(nb_species, nb_phyla, nb_genera, archaea_fraction, rng)
+    write_taxonomy(genera, output_dir)
+    nb_og, nb_genes = write_orthogroups(genera, output_dir, nb_og, mean_og_species, paralog_rate, rng)
+    print(f"Finished. Synthetic OrthoDB ({nb_og} OGs, {nb_genes} genes, {nb_species} species) is here : {output_dir}")
+
+##################################################################################################################################################
+#
+# MAIN
+#
+##################################################################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generates a synthetic OrthoDB release (OG2genes, OGs, level2species, species and levels tables) of configurable size, \
+                     to measure the scaling of the TaxonMarker scripts (see benchmark.py).",
+        epilog="Exemple: python synthetic_orthodb.py -o synthetic_orthodb --nb_og 100000 --nb_species 2000 --paralog_rate 0.1")
+    parser.add_argument('-o','--output_dir', dest="output_dir", help="OUTPUT: directory of the synthetic tables", required=True)
+    parser.add_argument('--nb_og', type=int, default=10000, help="number of OGs (default: 10000)")
+    parser.add_argument('--nb_species', type=int, default=1000, help="number of species (default: 1000)")
+    parser.add_argument('--paralog_rate', type=float, default=0.1, help="probability of one more copy of the gene in a species, repeated for each copy (default: 0.1)")
+    parser.add_argument('--mean_og_species', type=float, default=20, help="mean number of species per OG (default: 20)")
+    parser.add_argument('--nb_phyla', type=int, default=10, help="number of phyla (default: 10)")
+    parser.add_argument('--nb_genera', type=int, default=100, help="number of genera (default: 100)")
+    parser.add_argument('--archaea_fraction', type=float, default=0.1, help="fraction of the phyla in Archaea, whose OGs are filtered out by STEP0 (default: 0.1)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random generator (default: 0)")
+    args = parser.parse_args()
+
+    if not 0 <= args.paralog_rate < 1:
+        parser.error("--paralog_rate must be in [0, 1)")
+
+    try:
+        generate_orthodb(args.output_dir, args.nb_og, args.nb_species, args.paralog_rate, args.mean_og_species,
+                         args.nb_phyla, args.nb_genera, args.archaea_fraction, args.seed)
+    except Exception as e:
+        print(f"an error has occured : {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+__author__ = 'Gabryelle Agoutin - INRAE'
+__copyright__ = 'Copyright (C) 2024 INRAE'
+__license__ = 'GNU General Public License'
+__version__ = '1.0'
+__email__ = 'gabryelle.agoutin@inrae.fr'
+__status__ = 'prod'
+
+
+import io
+import os
+import bz2
+import gzip
+import shutil
+import subprocess
+from contextlib import contextmanager
+
+
+# Multithreaded (de)compressors tried first, in order of preference. {threads} is
+# replaced by the number of threads.
+EXTERNAL_COMMANDS = {
+    'gz': [(['pigz', '-dc', '-p', '{threads}'], ['pigz', '-c', '-p', '{threads}'])],
+    'bz2': [(['lbzip2', '-dc', '-n', '{threads}'], ['lbzip2', '-c', '-n', '{threads}']),
+            (['pbzip2', '-dc', '-p{threads}'], ['pbzip2', '-c', '-p{threads}'])],
+    'zst': [(['zstd', '-dcq', '-T{threads}'], ['zstd', '-cq', '-T{threads}'])],
+}
+
+##################################################################################################################################################
+#
+# FUNCTIONS
+#
+##################################################################################################################################################
+
+def compression_of(path):
+    '''
+    Returns 'gz', 'bz2' or 'zst' according to the extension of path, None for a plain file.
+    '''
+    for compression in EXTERNAL_COMMANDS:
+        if path.endswith('.' + compression):
+            return compression
+    return None
+
+def is_compressed(path):
+    '''
+    Returns True if path is read or written through a (de)compressor.
+    '''
+    return compression_of(path) is not None
+
+def external_command(compression, reading, threads):
+    '''
+    Returns the command line of the first multithreaded (de)compressor found
+    in the PATH for compression, or None.
+    '''
+    for read_command, write_command in EXTERNAL_COMMANDS[compression]:
+        command = read_command if reading else write_command
+        if shutil.which(command[0]):
+            return [arg.format(threads=threads) for arg in command]
+    return None
+
+def open_with_module(path, compression, mode):
+    '''
+    Opens path with the Python module of compression (single-threaded fallback).
+    '''
+    if compression == 'gz':
+        return gzip.open(path, mode)
+    if compression == 'bz2':
+        return bz2.open(path, mode)
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(f"{path} is compressed with zstd: install the zstd command or the zstandard Python module")
+    return zstandard.open(path, mode)
+
+@contextmanager
+def open_compressed(path, mode='r', threads=None):
+    '''
+    Opens path like open(), transparently (de)compressing .gz, .bz2 and .zst
+    files, for reading ('r', 'rt', 'rb') or writing ('w', 'wt', 'wb').
+
+    When pigz, lbzip2/pbzip2 or zstd is available, the data is streamed
+    through it with threads threads (default: all the CPUs), otherwise
+    through the gzip, bz2 or zstandard module. Plain files are opened as is.
+    '''
+    compression = compression_of(path)
+    if compression is None:
+        with open(path, mode) as f:
+            yield f
+        return
+
+    reading = mode.startswith('r')
+    text = 'b' not in mode
+    command = external_command(compression, reading, threads or os.cpu_count() or 1)
+
+    if command is None:
+        with open_with_module(path, compression, mode[0] + ('t' if text else 'b')) as f:
+            yield f
+        return
+
+    with open(path, 'rb' if reading else 'wb') as raw:
+        if reading:
+            process = subprocess.Popen(command, stdin=raw, stdout=subprocess.PIPE)
+            stream = process.stdout
+        else:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=raw)
+            stream = process.stdin
+        f = io.TextIOWrapper(stream) if text else stream
+        completed = False
+        try:
+            yield f
+            # A reader that stopped before the end of the data does not need the decompressor anymore
+            completed = not reading or stream.read(1) == b''
+        finally:
+            if not completed and process.poll() is None:
+                process.terminate()
+            f.close()
+            returncode = process.wait()
+        if completed and returncode != 0:
+            raise OSError(f"{command[0]} failed on {path} (exit code {returncode})")
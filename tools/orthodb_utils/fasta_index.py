@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+__author__ = 'Gabryelle Agoutin - INRAE'
+__copyright__ = 'Copyright (C) 2024 INRAE'
+__license__ = 'GNU General Public License'
+__version__ = '1.0'
+__email__ = 'gabryelle.agoutin@inrae.fr'
+__status__ = 'prod'
+
+
+import os
+import sys
+import argparse
+
+from compressed_io import open_compressed, is_compressed
+
+
+# Increase when the layout of the index changes
+INDEX_VERSION = 1
+
+##################################################################################################################################################
+#
+# FUNCTIONS
+#
+##################################################################################################################################################
+
+def default_index_path(fasta_path):
+    '''
+    Returns the default path of the index of a bulk FASTA file: next to it.
+    '''
+    return fasta_path + '.gene_index.tsv'
+
+def fasta_signature(fasta_path):
+    '''
+    Returns the first line of an index of the current version of fasta_path.
+    '''
+    stat = os.stat(fasta_path)
+    return f"#fasta_index\t{INDEX_VERSION}\t{stat.st_size}\t{stat.st_mtime}\n"
+
+def build_fasta_index(fasta_path, index_path=None):
+    '''
+    Indexes a plain (uncompressed) bulk FASTA file of OrthoDB (e.g.
+    odb11v0_cds_fasta), faidx-style: one line per record giving its gene id
+    (first word of the header, e.g. 1423_0:000589), the byte offset of its
+    header and its length in bytes, so a record is read with one seek.
+    '''
+    if is_compressed(fasta_path):
+        raise ValueError(f"{fasta_path} is compressed: decompress it to index it (or read it without index)")
+    index_path = index_path or default_index_path(fasta_path)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    nb_records = 0
+    with open(fasta_path, 'rb') as fasta, open(tmp_path, 'w') as index:
+        index.write(fasta_signature(fasta_path))
+        gene_id, start, offset = None, 0, 0
+        for line in fasta:
+            if line.startswith(b'>'):
+                if gene_id is not None:
+                    index.write(f"{gene_id}\t{start}\t{offset - start}\n")
+                    nb_records += 1
+                fields = line[1:].split()
+                gene_id, start = (fields[0].decode() if fields else ''), offset
+            offset += len(line)
+        if gene_id is not None:
+            index.write(f"{gene_id}\t{start}\t{offset - start}\n")
+            nb_records += 1
+    os.replace(tmp_path, index_path)
+    print(f"Finished. The index of {fasta_path} ({nb_records} records) is here : {index_path}")
+    return index_path
+
+def is_current_index(fasta_path, index_path):
+    '''
+    Returns True if index_path is an index of the current version of fasta_path.
+    '''
+    try:
+        with open(index_path, 'r') as f:
+            return f.readline() == fasta_signature(fasta_path)
+    except OSError:
+        return False
+
+def lookup_fasta_offsets(index_path, gene_ids):
+    '''
+    Returns {gene_id: (offset, length)} for the gene_ids found in the index,
+    with one sequential read of the index.
+    '''
+    gene_ids = set(gene_ids)
+    offsets = {}
+    with open(index_path, 'r') as f:
+        next(f, None)
+        for line in f:
+            gene_id, offset, length = line.rstrip('\n').split('\t')
+            if gene_id in gene_ids:
+                offsets[gene_id] = (int(offset), int(length))
+    return offsets
+
+def read_indexed_records(fasta_path, offsets):
+    '''
+    Reads the records at offsets ({gene_id: (offset, length)}, see
+    lookup_fasta_offsets) in the order of the file, so the file is read in
+    one forward pass whatever the order of the genes in the OGs.
+    Returns {gene_id: record (header and sequence lines)}.
+    '''
+    records = {}
+    with open(fasta_path, 'rb') as fasta:
+        for gene_id, (offset, length) in sorted(offsets.items(), key=lambda item: item[1][0]):
+            fasta.seek(offset)
+            records[gene_id] = fasta.read(length).decode()
+    return records
+
+def scan_fasta_records(fasta_path, gene_ids):
+    '''
+    Returns {gene_id: record} for the gene_ids of fasta_path (plain or
+    compressed) with one sequential read of the whole file, without index.
+    '''
+    gene_ids = set(gene_ids)
+    records = {}
+    gene_id, lines = None, []
+    with open_compressed(fasta_path, 'r') as fasta:
+        for line in fasta:
+            if line.startswith('>'):
+                if gene_id is not None:
+                    records[gene_id] = ''.join(lines)
+                fields = line[1:].split()
+                gene_id = fields[0] if fields and fields[0] in gene_ids else None
+                lines = [line]
+            elif gene_id is not None:
+                lines.append(line)
+        if gene_id is not None:
+            records[gene_id] = ''.join(lines)
+    return records
+
+def extract_fasta_records(fasta_path, gene_ids, index_path=None):
+    '''
+    Returns {gene_id: record} for the gene_ids found in a bulk FASTA file of OrthoDB.
+
+    A plain file is read through its index (see build_fasta_index), built
+    if it is missing or older than the file. A compressed file cannot be
+    read at an offset: it is scanned once from the start (see scan_fasta_records).
+    '''
+    if is_compressed(fasta_path):
+        return scan_fasta_records(fasta_path, gene_ids)
+    index_path = index_path or default_index_path(fasta_path)
+    if not is_current_index(fasta_path, index_path):
+        build_fasta_index(fasta_path, index_path)
+    return read_indexed_records(fasta_path, lookup_fasta_offsets(index_path, gene_ids))
+
+##################################################################################################################################################
+#
+# MAIN
+#
+##################################################################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Indexes a bulk FASTA file of OrthoDB (e.g. the nucleotide sequences of the CDS, odb11v0_cds_fasta) by gene id, \
+                     so fastas_recovery.py --cds_fasta can read the sequences of the selected OGs without the APIs, or prints the records of -q.",
+        epilog="Exemple: python fasta_index.py -f ../Orthodb/odb11v0_cds_fasta -q 1423_0:000589")
+    parser.add_argument('-f','--fasta', dest="fasta", help="INPUT: bulk FASTA file of OrthoDB (uncompressed to be indexed)", required=True)
+    parser.add_argument('-i','--index', dest="index", help="index of the FASTA file (default: <fasta>.gene_index.tsv)")
+    parser.add_argument('-q','--query', nargs='+', help="gene ids whose records are printed")
+    args = parser.parse_args()
+
+    try:
+        if args.query:
+            records = extract_fasta_records(args.fasta, args.query, args.index)
+            for gene_id in args.query:
+                sys.stdout.write(records.get(gene_id, f"{gene_id}\tnot found\n"))
+        else:
+            build_fasta_index(args.fasta, args.index)
+    except Exception as e:
+        print(f"an error has occured : {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+__author__ = 'Gabryelle Agoutin - INRAE'
+__copyright__ = 'Copyright (C) 2024 INRAE'
+__license__ = 'GNU General Public License'
+__version__ = '1.0'
+__email__ = 'gabryelle.agoutin@inrae.fr'
+__status__ = 'prod'
+
+
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Base URLs of the APIs, replaced by the URL of a local server to test without network
+ORTHODB_URL = 'https://data.orthodb.org'
+ENA_URL = 'https://www.ebi.ac.uk/ena/browser/api'
+
+# HTTP codes worth retrying: too many requests and temporary server errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+##################################################################################################################################################
+#
+# FUNCTIONS
+#
+##################################################################################################################################################
+
+def token_bucket(rate, burst=None):
+    '''
+    Returns a token bucket allowing rate requests per second on average, and
+    bursts of burst requests (default: rate, at least 1). See take_token.
+    '''
+    capacity = max(1.0, float(burst if burst is not None else rate))
+    return {'rate': float(rate), 'capacity': capacity, 'tokens': capacity,
+            'updated': time.monotonic(), 'lock': threading.Lock()}
+
+def take_token(bucket):
+    '''
+    Takes a token from the bucket, waiting for it to be refilled if it is empty.
+    A bucket with a rate <= 0 never waits.
+    '''
+    if bucket['rate'] <= 0:
+        return
+    while True:
+        with bucket['lock']:
+            now = time.monotonic()
+            bucket['tokens'] = min(bucket['capacity'], bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+            bucket['updated'] = now
+            if bucket['tokens'] >= 1:
+                bucket['tokens'] -= 1
+                return
+            wait = (1 - bucket['tokens']) / bucket['rate']
+        time.sleep(wait)
+
+def http_client(concurrency_per_host=4, rate_per_host=5.0, retries=3, timeout=30):
+    '''
+    Returns a client for http_get: one requests.Session whose connections are
+    kept alive and shared by all the threads, at most concurrency_per_host
+    requests in flight and rate_per_host requests per second (token bucket)
+    for each host.
+    '''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(1, concurrency_per_host))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return {'session': session, 'concurrency_per_host': max(1, concurrency_per_host), 'rate_per_host': rate_per_host,
+            'retries': retries, 'timeout': timeout, 'hosts': {}, 'lock': threading.Lock()}
+
+def host_limits(client, url):
+    '''
+    Returns the (semaphore, token bucket) of the host of url, created at its first request.
+    '''
+    host = urlsplit(url).netloc
+    with client['lock']:
+        if host not in client['hosts']:
+            client['hosts'][host] = (threading.BoundedSemaphore(client['concurrency_per_host']),
+                                     token_bucket(client['rate_per_host']))
+        return client['hosts'][host]
+
+def retry_delay(response, attempt):
+    '''
+    Returns the number of seconds to wait before retrying: the Retry-After header
+    of the response if any, otherwise an exponential backoff.
+    '''
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return int(retry_after)
+    return min(60, 2 ** attempt)
+
+def http_get(client, url, params=None):
+    '''
+    GET url through the client (see http_client), within the limits of its host.
+    Connection errors, timeouts and the RETRY_STATUS codes are retried up to
+    client['retries'] times. Returns the last response; raises the last
+    requests exception if no response was obtained.
+    '''
+    semaphore, bucket = host_limits(client, url)
+    for attempt in range(client['retries'] + 1):
+        take_token(bucket)
+        response = None
+        try:
+            with semaphore:
+                response = client['session'].get(url, params=params, timeout=client['timeout'])
+            if response.status_code not in RETRY_STATUS:
+                return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == client['retries']:
+                raise
+        if attempt < client['retries']:
+            time.sleep(retry_delay(response, attempt))
+    return response
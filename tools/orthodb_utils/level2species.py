@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+__author__ = 'Gabryelle Agoutin - INRAE'
+__copyright__ = 'Copyright (C) 2024 INRAE'
+__license__ = 'GNU General Public License'
+__version__ = '1.0'
+__email__ = 'gabryelle.agoutin@inrae.fr'
+__status__ = 'prod'
+
+
+import os
+import sys
+import pickle
+import argparse
+
+from compressed_io import open_compressed
+
+
+# Increase when the structure of the cached index changes
+INDEX_VERSION = 2
+
+##################################################################################################################################################
+#
+# FUNCTIONS
+#
+##################################################################################################################################################
+
+def parse_level2species(level2species_path):
+    '''
+    Builds the taxonomy tree of the OrthoDB levels and indexes it for clade queries.
+
+    Parameters:
+        level2species_path (str): Path to odb11v0_level2species.tab. Its columns are
+            the top-most level, the OrthoDB species identifier (e.g. 1000588_0),
+            the number of hops and the list of levels from the top to the species
+            (e.g. {2,1239,91061}).
+
+    Returns:
+        dict with:
+            'parents': level (str) -> parent level (None for a top-most level).
+            'species': tuple of the OrthoDB species identifiers, in the order of a
+                depth-first walk of the tree: the species of any clade are contiguous.
+            'species_positions': species identifier -> position in 'species'.
+            'species_intervals': level -> (start, end): the species of the clade are
+                species[start:end].
+            'level_intervals': level -> (entry, exit) times of the depth-first walk
+                (Euler tour): a level is in a clade iff its entry time is in the
+                interval of the clade.
+
+        So the membership of a species or a level in a clade is a range check, and
+        the memory used is linear in the number of species and levels (instead of
+        a copy of each species for each of its levels).
+    '''
+    parents = {}
+    species_level = {}
+    with open_compressed(level2species_path, 'r') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 2:
+                continue
+            path = [fields[0]]
+            if len(fields) >= 4:
+                for level in fields[3].strip('{}').split(','):
+                    if level and level not in path:
+                        path.append(level)
+            parents.setdefault(path[0], None)
+            for parent, level in zip(path, path[1:]):
+                if parents.setdefault(level, parent) != parent:
+                    raise ValueError(f"the level {level} has two parents in {level2species_path}: "
+                                     f"{parents[level]} and {parent}")
+            species_level[fields[1]] = path[-1]
+
+    children = {}
+    for level, parent in parents.items():
+        children.setdefault(parent, []).append(level)
+    species_by_level = {}
+    for species, level in species_level.items():
+        species_by_level.setdefault(level, []).append(species)
+
+    def sort_key(taxid):
+        return (0, int(taxid), taxid) if taxid.isdigit() else (1, 0, taxid)
+
+    # Iterative depth-first walk, the species of each level are placed before its children
+    species_order = []
+    species_intervals = {}
+    level_intervals = {}
+    time = 0
+    stack = [(level, False) for level in sorted(children.get(None, []), key=sort_key, reverse=True)]
+    while stack:
+        level, done = stack.pop()
+        if done:
+            species_intervals[level] = (species_intervals[level], len(species_order))
+            level_intervals[level] = (level_intervals[level], time)
+            continue
+        species_intervals[level] = len(species_order)
+        level_intervals[level] = time
+        time += 1
+        species_order.extend(sorted(species_by_level.get(level, [])))
+        stack.append((level, True))
+        stack.extend((child, False) for child in sorted(children.get(level, []), key=sort_key, reverse=True))
+
+    return {'parents': parents,
+            'species': tuple(species_order),
+            'species_positions': {species: i for i, species in enumerate(species_order)},
+            'species_intervals': species_intervals,
+            'level_intervals': level_intervals}
+
+def default_cache_path(level2species_path):
+    '''
+    Returns the default path of the cached index: next to level2species_path.
+    '''
+    return level2species_path + '.level_index.pkl'
+
+def read_cached_index(level2species_path, cache_path):
+    '''
+    Returns the index stored in cache_path if it was built from the current
+    version of level2species_path, None otherwise.
+    '''
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    stat = os.stat(level2species_path)
+    if (cached.get('version') != INDEX_VERSION or cached.get('size') != stat.st_size
+            or cached.get('mtime') != stat.st_mtime):
+        return None
+    return cached['index']
+
+def write_cached_index(level2species_path, cache_path, index):
+    '''
+    Writes the index to cache_path. A cache that cannot be written (e.g. read-only
+    OrthoDB directory) is only reported, the index is then rebuilt at each run.
+    '''
+    stat = os.stat(level2species_path)
+    cached = {'version': INDEX_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime, 'index': index}
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: the level2species index could not be cached in {cache_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# Indexes already loaded by this process, by level2species path
+loaded_indexes = {}
+
+def load_level2species_index(level2species_path, cache_path=None, use_cache=True):
+    '''
+    Returns the taxonomy index of level2species_path (see parse_level2species).
+
+    The index is built once, then cached on disk (by default next to
+    level2species_path) and reused as long as level2species_path is unchanged.
+    Within a process, it is only loaded once.
+    '''
+    if level2species_path in loaded_indexes:
+        return loaded_indexes[level2species_path]
+
+    index = None
+    if use_cache:
+        cache_path = cache_path or default_cache_path(level2species_path)
+        index = read_cached_index(level2species_path, cache_path)
+    if index is None:
+        index = parse_level2species(level2species_path)
+        if use_cache:
+            write_cached_index(level2species_path, cache_path, index)
+
+    loaded_indexes[level2species_path] = index
+    return index
+
+def species_at_level(level2species_path, level, cache_path=None, use_cache=True):
+    '''
+    Returns the OrthoDB species identifiers (e.g. 1000588_0) having the taxonomic
+    level in their taxonomy: 2 for Bacteria, 2157 for Archaea, 1578 for
+    Lactobacillus, ... An empty frozenset is returned for an unknown level.
+    '''
+    index = load_level2species_index(level2species_path, cache_path, use_cache)
+    start, end = index['species_intervals'].get(str(level), (0, 0))
+    return frozenset(index['species'][start:end])
+
+def in_clade(level2species_path, level, taxid, cache_path=None, use_cache=True):
+    '''
+    Returns True if taxid, an OrthoDB species identifier (e.g. 1000588_0) or a
+    level, belongs to the clade of level (a level belongs to its own clade).
+    This is a range check on the intervals of the index.
+    '''
+    index = load_level2species_index(level2species_path, cache_path, use_cache)
+    level, taxid = str(level), str(taxid)
+    if level not in index['level_intervals']:
+        return False
+    if taxid in index['species_positions']:
+        start, end = index['species_intervals'][level]
+        return start <= index['species_positions'][taxid] < end
+    if taxid in index['level_intervals']:
+        entry, exit_ = index['level_intervals'][level]
+        return entry <= index['level_intervals'][taxid][0] < exit_
+    return False
+
+def clade_path(level2species_path, level, cache_path=None, use_cache=True):
+    '''
+    Returns the levels from the top-most level down to level (empty for an unknown level).
+    '''
+    parents = load_level2species_index(level2species_path, cache_path, use_cache)['parents']
+    path = []
+    level = str(level)
+    while level is not None and level in parents:
+        path.append(level)
+        level = parents[level]
+    return path[::-1]
+
+def sub_levels(level2species_path, level, cache_path=None, use_cache=True):
+    '''
+    Returns the levels directly under level in the taxonomy tree.
+    '''
+    index = load_level2species_index(level2species_path, cache_path, use_cache)
+    level = str(level)
+    return sorted((child for child, parent in index['parents'].items() if parent == level),
+                  key=lambda child: index['level_intervals'][child])
+
+def load_level_names(levels_path):
+    '''
+    Returns level -> name from odb11v0_levels.tab (level, name, ...).
+    '''
+    names = {}
+    with open_compressed(levels_path, 'r') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 2:
+                names[fields[0]] = fields[1]
+    return names
+
+##################################################################################################################################################
+#
+# MAIN
+#
+##################################################################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Builds (or reuses) the cached taxonomy index of odb11v0_level2species.tab and describes the clades of the given levels: \
+                     lineage, number of species and sub-levels.",
+        epilog="Exemple: python level2species.py -s ../Orthodb/odb11v0_level2species.tab -n ../Orthodb/odb11v0_levels.tab -q 2 1239 1578")
+    parser.add_argument('-s','--level2species_file', dest="level2species_file", help="INPUT: odb11v0_level2species.tab", required=True)
+    parser.add_argument('-n','--levels_file', dest="levels_file", help="INPUT: odb11v0_levels.tab, to print the names of the levels")
+    parser.add_argument('-q','--query', nargs='+', default=[], help="levels (NCBI taxids) to describe")
+    args = parser.parse_args()
+
+    try:
+        index = load_level2species_index(args.level2species_file)
+        names = load_level_names(args.levels_file) if args.levels_file else {}
+        print(f"{len(index['level_intervals'])} levels, {len(index['species'])} species")
+        for level in args.query:
+            if level not in index['level_intervals']:
+                print(f"{level}\tnot found")
+                continue
+            start, end = index['species_intervals'][level]
+            lineage = ' > '.join(names.get(parent, parent) for parent in clade_path(args.level2species_file, level))
+            children = ', '.join(f"{child} ({names[child]})" if child in names else child for child in sub_levels(args.level2species_file, level))
+            print(f"{level}\t{names.get(level, '')}\t{end - start} species\t{lineage}\tsub-levels: {children}")
+    except Exception as e:
+        print(f"an error has occured : {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+__author__ = 'Gabryelle Agoutin - INRAE'
+__copyright__ = 'Copyright (C) 2024 INRAE'
+__license__ = 'GNU General Public License'
+__version__ = '1.0'
+__email__ = 'gabryelle.agoutin@inrae.fr'
+__status__ = 'prod'
+
+
+import os
+import sys
+import sqlite3
+import argparse
+
+from compressed_io import open_compressed
+
+
+# Number of rows inserted per transaction when building the index
+BATCH_SIZE = 100000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ogs (og_id TEXT PRIMARY KEY, level INTEGER, name TEXT) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS og_genes (og_id TEXT PRIMARY KEY, gene_ids TEXT, species_ids TEXT) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS gene_xrefs (gene_id TEXT, xref_type TEXT, xref_id TEXT, PRIMARY KEY (gene_id, xref_type, xref_id)) WITHOUT ROWID;
+'''
+
+##################################################################################################################################################
+#
+# FUNCTIONS
+#
+##################################################################################################################################################
+
+def is_og_index(path):
+    '''
+    Returns True if path is an SQLite file (e.g. an index built by build_og_index).
+    '''
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(16) == b'SQLite format 3\x00'
+
+def insert_rows(connection, query, rows):
+    '''
+    Inserts rows (an iterable of tuples) with query, BATCH_SIZE rows per transaction.
+    '''
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            connection.executemany(query, batch)
+            connection.commit()
+            batch = []
+    connection.executemany(query, batch)
+    connection.commit()
+
+def iter_OGs_tab(OGs_tab_file):
+    '''
+    Yields (OG_id, level, name) from odb11v0_OGs.tab.
+    '''
+    with open_compressed(OGs_tab_file, 'r') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 3:
+                level = int(fields[1]) if fields[1].isdigit() else None
+                yield fields[0], level, fields[2]
+
+def iter_og_table(og_table):
+    '''
+    Yields (OG_id, gene_ids, species_ids) from a table written by
+    formatting_bacterial_orthologue_file.py (Bacterial_OG.tab).
+    '''
+    with open_compressed(og_table, 'r') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if fields[0] == 'OG_id' or len(fields) < 3:
+                continue
+            yield fields[0], fields[1], fields[2]
+
+def iter_gene_xrefs(gene_xrefs_file, xref_types):
+    '''
+    Yields (gene_id, xref_type, xref_id) from odb11v0_gene_xrefs.tab for the
+    cross-references whose type is in xref_types.
+    '''
+    with open_compressed(gene_xrefs_file, 'r') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 3 and fields[2] in xref_types:
+                yield fields[0], fields[2], fields[1]
+
+def build_og_index(index_path, OGs_tab_file=None, og_table=None, gene_xrefs_file=None, xref_types=('EMBLCDS',)):
+    '''
+    Builds (or completes) the SQLite index index_path from any of:
+        OGs_tab_file (str): odb11v0_OGs.tab: level and name of each OG.
+        og_table (str): Bacterial_OG.tab: genes and species of each bacterial OG.
+        gene_xrefs_file (str): odb11v0_gene_xrefs.tab: cross-references of the
+            genes, restricted to xref_types (by default the EMBLCDS ids used by
+            fastas_recovery.py to download the nucleic sequences).
+
+    Every table is keyed by OG_id or gene id, so a lookup is a single B-tree
+    search whatever the size of OrthoDB.
+    '''
+    connection = sqlite3.connect(index_path)
+    connection.executescript(SCHEMA)
+    if OGs_tab_file:
+        insert_rows(connection, 'INSERT OR REPLACE INTO ogs VALUES (?, ?, ?)', iter_OGs_tab(OGs_tab_file))
+        print(f"OGs of {OGs_tab_file} indexed")
+    if og_table:
+        insert_rows(connection, 'INSERT OR REPLACE INTO og_genes VALUES (?, ?, ?)', iter_og_table(og_table))
+        print(f"OG genes of {og_table} indexed")
+    if gene_xrefs_file:
+        insert_rows(connection, 'INSERT OR REPLACE INTO gene_xrefs VALUES (?, ?, ?)', iter_gene_xrefs(gene_xrefs_file, set(xref_types)))
+        print(f"{', '.join(xref_types)} cross-references of {gene_xrefs_file} indexed")
+    connection.close()
+    print("Finished. The OrthoDB index is here :", index_path)
+
+# Read-only connections already opened by this process, by index path
+connections = {}
+
+def open_og_index(index_path):
+    '''
+    Returns a read-only connection to the index, opened once per process.
+    '''
+    key = (index_path, os.getpid())
+    if key not in connections:
+        if not is_og_index(index_path):
+            raise ValueError(f"{index_path} is not an OrthoDB index built by og_index.py")
+        connections[key] = sqlite3.connect(f"file:{os.path.abspath(index_path)}?mode=ro", uri=True, check_same_thread=False)
+    return connections[key]
+
+def lookup_og(index_path, OG_id):
+    '''
+    Returns the indexed information of OG_id as a dictionary:
+    {'OG_id', 'level', 'name', 'gene_ids' (list), 'species_ids' (list)},
+    or None if OG_id is unknown.
+    '''
+    return lookup_ogs(index_path, [OG_id]).get(OG_id)
+
+def lookup_ogs(index_path, OG_ids):
+    '''
+    Batch version of lookup_og: returns {OG_id: information} for the known OG_ids.
+    '''
+    connection = open_og_index(index_path)
+    OG_ids = list(OG_ids)
+    result = {}
+    for start in range(0, len(OG_ids), 500):
+        batch = OG_ids[start:start + 500]
+        placeholders = ','.join('?' * len(batch))
+        for OG_id, level, name in connection.execute(f'SELECT og_id, level, name FROM ogs WHERE og_id IN ({placeholders})', batch):
+            result[OG_id] = {'OG_id': OG_id, 'level': level, 'name': name, 'gene_ids': [], 'species_ids': []}
+        for OG_id, gene_ids, species_ids in connection.execute(f'SELECT og_id, gene_ids, species_ids FROM og_genes WHERE og_id IN ({placeholders})', batch):
+            info = result.setdefault(OG_id, {'OG_id': OG_id, 'level': None, 'name': '', 'gene_ids': [], 'species_ids': []})
+            info['gene_ids'] = gene_ids.split(';') if gene_ids else []
+            info['species_ids'] = species_ids.split(';') if species_ids else []
+    return result
+
+def og_names(index_path, OG_ids=None):
+    '''
+    Returns {OG_id: name} for OG_ids, or for all the indexed OGs if OG_ids is None.
+    '''
+    if OG_ids is None:
+        return dict(open_og_index(index_path).execute('SELECT og_id, name FROM ogs'))
+    return {OG_id: info['name'] for OG_id, info in lookup_ogs(index_path, OG_ids).items()}
+
+def lookup_xref(index_path, gene_id, xref_type='EMBLCDS'):
+    '''
+    Returns the first xref_type cross-reference of gene_id (e.g. its EMBLCDS id), or None.
+    '''
+    row = open_og_index(index_path).execute(
+        'SELECT xref_id FROM gene_xrefs WHERE gene_id = ? AND xref_type = ? LIMIT 1', (gene_id, xref_type)).fetchone()
+    return row[0] if row else None
+
+##################################################################################################################################################
+#
+# MAIN
+#
+##################################################################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Builds a local SQLite index of the OrthoDB tables, so the OGs (and the EMBLCDS ids of their genes) can be looked up by id \
+                     without re-reading the tables, or queries it with -q.",
+        epilog="Exemple: python og_index.py -o orthodb_index.sqlite -g ../Orthodb/odb11v0_OGs.tab -t Bacterial_OG.tab -x ../Orthodb/odb11v0_gene_xrefs.tab")
+    parser.add_argument('-o','--index', dest="index", help="SQLite index to build or query", required=True)
+    parser.add_argument('-g','--OGs_tab_file', dest="OGs_tab_file", help="INPUT: odb11v0_OGs.tab")
+    parser.add_argument('-t','--og_table', dest="og_table", help="INPUT: Bacterial_OG.tab")
+    parser.add_argument('-x','--gene_xrefs_file', dest="gene_xrefs_file", help="INPUT: odb11v0_gene_xrefs.tab")
+    parser.add_argument('--xref_types', nargs='+', default=['EMBLCDS'], help="types of cross-references indexed from -x (default: EMBLCDS)")
+    parser.add_argument('-q','--query', nargs='+', help="OG ids to look up in the index")
+    args = parser.parse_args()
+
+    try:
+        if args.OGs_tab_file or args.og_table or args.gene_xrefs_file:
+            build_og_index(args.index, args.OGs_tab_file, args.og_table, args.gene_xrefs_file, args.xref_types)
+        if args.query:
+            found = lookup_ogs(args.index, args.query)
+            for OG_id in args.query:
+                info = found.get(OG_id)
+                if info is None:
+                    print(f"{OG_id}\tnot found")
+                else:
+                    print(f"{OG_id}\t{info['level']}\t{info['name']}\t{len(info['gene_ids'])} genes")
+    except Exception as e:
+        print(f"an error has occured : {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
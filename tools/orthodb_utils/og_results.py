@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+__author__ = 'Gabryelle Agoutin - INRAE'
+__copyright__ = 'Copyright (C) 2024 INRAE'
+__license__ = 'GNU General Public License'
+__version__ = '1.0'
+__email__ = 'gabryelle.agoutin@inrae.fr'
+__status__ = 'prod'
+
+
+import os
+import csv
+
+from compressed_io import open_compressed
+
+
+# Columns of the statistics table written by search_taxid_and_monocopy_and_percentage_calculation.py --slim
+SLIM_FIELDNAMES = ['OG_ID', 'ProteinCount', 'SpeciesCount', 'nb_single_copy', 'percent_single_copy', 'gene_name', 'TargetSpecies_Count', 'TargetSpecies_Percentage']
+
+# Columns of its members table: the proteins and species of each OG, in the same order as the statistics table
+MEMBER_FIELDNAMES = ['OG_ID', 'ProteinID', 'taxids', 'species']
+
+##################################################################################################################################################
+#
+# FUNCTIONS
+#
+##################################################################################################################################################
+
+def members_path(og_results_path):
+    '''
+    Returns the path of the members table of a slim STEP1 table: OG_1578.tab -> OG_1578.members.tsv.gz
+    '''
+    root, _ = os.path.splitext(og_results_path)
+    return root + '.members.tsv.gz'
+
+def og_results_fieldnames(og_results_path):
+    '''
+    Returns the columns of a STEP1 table (full or slim), from its header.
+    '''
+    with open_compressed(og_results_path, 'r') as f:
+        return next(csv.reader(f, delimiter='\t'), [])
+
+def read_og_results(og_results_path, columns=None):
+    '''
+    Yields the rows of a STEP1 table as dictionaries restricted to columns
+    (default: the columns of the table).
+
+    For a slim table, the columns of MEMBER_FIELDNAMES it does not contain are
+    read from its members table (see members_path), which is only opened if one
+    of them is asked for: readers of the statistics alone never parse the
+    protein and species lists.
+    '''
+    with open_compressed(og_results_path, 'r') as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        columns = list(columns) if columns else list(reader.fieldnames)
+        missing = [column for column in columns if column not in reader.fieldnames]
+        if not missing:
+            for row in reader:
+                yield {column: row[column] for column in columns}
+            return
+
+        unknown = [column for column in missing if column not in MEMBER_FIELDNAMES]
+        if unknown:
+            raise ValueError(f"the columns {', '.join(unknown)} are not in {og_results_path}")
+        side_path = members_path(og_results_path)
+        if not os.path.isfile(side_path):
+            raise ValueError(f"{og_results_path} has no {', '.join(missing)} column and its members table {side_path} is not found")
+        with open_compressed(side_path, 'r') as side:
+            members = csv.DictReader(side, delimiter='\t')
+            for row in reader:
+                member = next(members, None)
+                if member is None or member['OG_ID'] != row['OG_ID']:
+                    raise ValueError(f"{side_path} does not match {og_results_path} at {row['OG_ID']}")
+                yield {column: row[column] if column in row else member[column] for column in columns}
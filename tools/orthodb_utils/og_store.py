@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+__author__ = 'Gabryelle Agoutin - INRAE'
+__copyright__ = 'Copyright (C) 2024 INRAE'
+__license__ = 'GNU General Public License'
+__version__ = '1.0'
+__email__ = 'gabryelle.agoutin@inrae.fr'
+__status__ = 'prod'
+
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+from compressed_io import open_compressed
+
+
+# Increase when the layout of the store changes
+STORE_VERSION = 1
+
+# Arrays of a store, each saved as <name>.npy in the store directory:
+#   og_ids (str), gene_names (str)     : one value per OG
+#   offsets (int64)                    : genes of OG i are gene_organisms[offsets[i]:offsets[i+1]]
+#   gene_organisms (int32)             : code of the OrthoDB organism of each gene (index in organisms)
+#   gene_locals (bytes)                : part of the gene id after ':' (e.g. 000589)
+#   organisms (str)                    : OrthoDB organism identifiers (e.g. 109790_1)
+#   organism_species (int32)           : code of the species of each organism (index in species)
+#   species (str)                      : species taxids, as in the species_id column (e.g. 109790)
+STORE_ARRAYS = ['og_ids', 'gene_names', 'offsets', 'gene_organisms', 'gene_locals', 'organisms', 'organism_species', 'species']
+
+##################################################################################################################################################
+#
+# FUNCTIONS
+#
+##################################################################################################################################################
+
+def is_og_store(path):
+    '''
+    Returns True if path is an OG store directory written by export_og_store.
+    '''
+    return os.path.isfile(os.path.join(path, 'meta.json'))
+
+def iter_og_table(og_table_path):
+    '''
+    Yields (OG_id, gene_ids, gene_name) for each line of a table written by
+    formatting_bacterial_orthologue_file.py (with or without header).
+    '''
+    with open_compressed(og_table_path, 'r') as f:
+        for line in f:
+            if line.startswith('OG_id\t'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 2:
+                continue
+            gene_ids = fields[1].split(';') if fields[1] else []
+            gene_name = fields[3] if len(fields) >= 4 else ''
+            yield fields[0], gene_ids, gene_name
+
+def export_og_store(og_table_path, store_path):
+    '''
+    Converts an OG table (Bacterial_OG.tab) into a columnar store: gene ids
+    are integer-encoded and the genes of all OGs are concatenated, with an
+    offset array giving the genes of each OG (CSR layout).
+
+    The table is read twice: once to size the arrays, once to fill them
+    through memory-mapped .npy files, so memory stays bounded by the
+    organism and species vocabularies.
+    '''
+    nb_og = 0
+    nb_genes = 0
+    local_width = 1
+    for OG_id, gene_ids, gene_name in iter_og_table(og_table_path):
+        nb_og += 1
+        nb_genes += len(gene_ids)
+        for gene_id in gene_ids:
+            if ':' not in gene_id:
+                raise ValueError(f"the gene id {gene_id} of {OG_id} has no ':'")
+            local_width = max(local_width, len(gene_id) - gene_id.index(':') - 1)
+
+    os.makedirs(store_path, exist_ok=True)
+    open_memmap = np.lib.format.open_memmap
+    offsets = open_memmap(os.path.join(store_path, 'offsets.npy'), mode='w+', dtype=np.int64, shape=(nb_og + 1,))
+    gene_organisms = open_memmap(os.path.join(store_path, 'gene_organisms.npy'), mode='w+', dtype=np.int32, shape=(nb_genes,))
+    gene_locals = open_memmap(os.path.join(store_path, 'gene_locals.npy'), mode='w+', dtype=f'S{local_width}', shape=(nb_genes,))
+
+    og_ids = []
+    gene_names = []
+    organism_codes = {}
+    species_codes = {}
+    organism_species = []
+    position = 0
+    offsets[0] = 0
+    for i, (OG_id, gene_ids, gene_name) in enumerate(iter_og_table(og_table_path)):
+        og_ids.append(OG_id)
+        gene_names.append(gene_name)
+        for gene_id in gene_ids:
+            organism, local = gene_id.split(':', 1)
+            code = organism_codes.get(organism)
+            if code is None:
+                code = organism_codes[organism] = len(organism_codes)
+                species = organism.split('_')[0]
+                if species not in species_codes:
+                    species_codes[species] = len(species_codes)
+                organism_species.append(species_codes[species])
+            gene_organisms[position] = code
+            gene_locals[position] = local.encode()
+            position += 1
+        offsets[i + 1] = position
+
+    for array in (offsets, gene_organisms, gene_locals):
+        array.flush()
+    del offsets, gene_organisms, gene_locals
+
+    np.save(os.path.join(store_path, 'og_ids.npy'), np.array(og_ids, dtype=str))
+    np.save(os.path.join(store_path, 'gene_names.npy'), np.array(gene_names, dtype=str))
+    np.save(os.path.join(store_path, 'organisms.npy'), np.array(list(organism_codes), dtype=str))
+    np.save(os.path.join(store_path, 'organism_species.npy'), np.array(organism_species, dtype=np.int32))
+    np.save(os.path.join(store_path, 'species.npy'), np.array(list(species_codes), dtype=str))
+
+    with open(os.path.join(store_path, 'meta.json'), 'w') as f:
+        json.dump({'version': STORE_VERSION, 'nb_og': nb_og, 'nb_genes': nb_genes,
+                   'source': os.path.abspath(og_table_path)}, f, indent=2)
+
+    print(f"Finished. The OG store ({nb_og} OGs, {nb_genes} genes) is here : {store_path}")
+
+def load_og_store(store_path):
+    '''
+    Loads an OG store written by export_og_store.
+
+    Returns:
+        dict: array name (see STORE_ARRAYS) -> numpy array. The per-gene
+            arrays are memory-mapped, so only the OGs actually read are
+            loaded in memory.
+    '''
+    with open(os.path.join(store_path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    if meta.get('version') != STORE_VERSION:
+        raise ValueError(f"the OG store {store_path} has version {meta.get('version')}, "
+                         f"expected {STORE_VERSION}: export it again")
+    store = {name: np.load(os.path.join(store_path, f'{name}.npy'), mmap_mode='r') for name in STORE_ARRAYS}
+    store['meta'] = meta
+    return store
+
+def species_mask(store, taxids):
+    '''
+    Returns a boolean array over the species codes of the store, True for
+    the species whose taxid is in taxids.
+    '''
+    taxids = set(taxids)
+    return np.array([species in taxids for species in store['species']], dtype=bool)
+
+def og_species_codes(store, i):
+    '''
+    Returns the species code of each gene of the OG number i.
+    '''
+    start, end = store['offsets'][i], store['offsets'][i + 1]
+    return store['organism_species'][store['gene_organisms'][start:end]]
+
+def og_store_row(store, i):
+    '''
+    Returns the OG number i as in the OG table: (OG_id, gene_ids, species_ids, gene_name),
+    gene_ids and species_ids being ';'-joined strings.
+    '''
+    start, end = store['offsets'][i], store['offsets'][i + 1]
+    organisms = store['organisms'][store['gene_organisms'][start:end]]
+    locals_ = store['gene_locals'][start:end]
+    gene_ids = ';'.join(f"{organism}:{local.decode()}" for organism, local in zip(organisms, locals_))
+    species_ids = ';'.join(store['species'][og_species_codes(store, i)])
+    return str(store['og_ids'][i]), gene_ids, species_ids, str(store['gene_names'][i])
+
+def matching_og_indices(store, mask, og_range=None):
+    '''
+    Returns the indices of the OGs of og_range (default: all the OGs) that
+    contain at least one species of mask (see species_mask).
+
+    The test is vectorized over the whole range: the species codes of all its
+    genes are looked up in mask at once, then reduced per OG with the offsets.
+    '''
+    start, end = og_range if og_range is not None else (0, len(store['og_ids']))
+    offsets = np.asarray(store['offsets'][start:end + 1])
+    if len(offsets) < 2 or offsets[-1] == offsets[0]:
+        return np.empty(0, dtype=np.int64)
+    hits = mask[store['organism_species'][store['gene_organisms'][offsets[0]:offsets[-1]]]]
+    # reduceat needs non-empty segments: empty OGs never match
+    non_empty = np.flatnonzero(np.diff(offsets))
+    any_hit = np.logical_or.reduceat(hits, offsets[:-1][non_empty] - offsets[0])
+    return start + non_empty[any_hit]
+
+def og_store_genes(store, indices):
+    '''
+    Returns the organism codes of the genes of the OGs indices (sorted),
+    concatenated, and their offsets: the genes of the k-th OG of indices are
+    gene_organisms[offsets[k]:offsets[k + 1]]. Nothing is decoded.
+    '''
+    indices = np.asarray(indices, dtype=np.int64)
+    starts = np.asarray(store['offsets'][indices])
+    lengths = np.asarray(store['offsets'][indices + 1]) - starts
+    offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    positions = np.arange(offsets[-1], dtype=np.int64) + np.repeat(starts - offsets[:-1], lengths)
+    return np.asarray(store['gene_organisms'][positions]), offsets
+
+def iter_og_store_rows(store, taxids=None, og_range=None, batch_size=10000):
+    '''
+    Yields the rows of the store (see og_store_row). If taxids is given,
+    only the OGs containing at least one of these species are decoded; they
+    are found batch_size OGs at a time by matching_og_indices.
+    og_range=(start, end) restricts the rows to the OGs start to end - 1.
+    '''
+    start, end = og_range if og_range is not None else (0, len(store['og_ids']))
+    if taxids is None:
+        for i in range(start, end):
+            yield og_store_row(store, i)
+        return
+
+    mask = species_mask(store, taxids)
+    for batch_start in range(start, end, batch_size):
+        batch_end = min(batch_start + batch_size, end)
+        for i in matching_og_indices(store, mask, (batch_start, batch_end)):
+            yield og_store_row(store, i)
+
+##################################################################################################################################################
+#
+# MAIN
+#
+##################################################################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Converts the bacterial OG table (Bacterial_OG.tab) into a compact columnar store (directory of .npy arrays) \
+                     that search_taxid_and_monocopy_and_percentage_calculation.py can read with -i instead of the text table.",
+        epilog="Exemple: python og_store.py -i Bacterial_OG.tab -o Bacterial_OG.store")
+    parser.add_argument('-i','--og_table', dest="og_table", help="INPUT: Bacterial_OG.tab", required=True)
+    parser.add_argument('-o','--store', dest="store", help="OUTPUT: directory of the OG store", required=True)
+    args = parser.parse_args()
+
+    try:
+        export_og_store(args.og_table, args.store)
+    except Exception as e:
+        print(f"an error has occured : {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
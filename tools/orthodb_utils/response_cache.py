@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+__author__ = 'Gabryelle Agoutin - INRAE'
+__copyright__ = 'Copyright (C) 2024 INRAE'
+__license__ = 'GNU General Public License'
+__version__ = '1.0'
+__email__ = 'gabryelle.agoutin@inrae.fr'
+__status__ = 'prod'
+
+
+import sys
+import time
+import zlib
+import sqlite3
+import argparse
+import threading
+
+
+# Kinds of cached answers: OrthoDB ogdetails (by protein id), ENA FASTA records (by EMBLCDS id),
+# OrthoDB group metadata of the HTML report (by OG id)
+OGDETAILS = 'ogdetails'
+ENA_FASTA = 'ena_fasta'
+OG_GROUP = 'og_group'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (kind TEXT, key TEXT, release TEXT, data BLOB, size INTEGER, fetched REAL, accessed REAL,
+                                      PRIMARY KEY (kind, key)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+'''
+
+##################################################################################################################################################
+#
+# FUNCTIONS
+#
+##################################################################################################################################################
+
+def open_response_cache(cache_path, release=None, ttl_days=None, max_size_mb=None, offline=False):
+    '''
+    Opens (or creates) an on-disk cache of API answers: an SQLite file keyed by
+    (kind, id), e.g. (OGDETAILS, protein id) or (ENA_FASTA, EMBLCDS id), whose
+    values are stored zlib-compressed.
+
+    An answer is a miss if it is older than ttl_days, or if it was tagged
+    with another release than release (e.g. the OrthoDB release, see
+    cache_put). max_size_mb is applied by close_response_cache, which evicts
+    the least recently used answers. offline only records that the caller
+    must not go to the network on a miss.
+
+    Returns:
+        dict used by cache_get, cache_put and close_response_cache. It can
+            be shared by threads.
+    '''
+    connection = sqlite3.connect(cache_path, check_same_thread=False, timeout=60)
+    # WAL lets several runs share the cache while one of them writes
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(SCHEMA)
+    return {'connection': connection, 'lock': threading.Lock(), 'path': cache_path, 'release': release,
+            'ttl': ttl_days * 86400 if ttl_days else None, 'max_size': max_size_mb * 1e6 if max_size_mb else None,
+            'offline': offline, 'hits': 0, 'misses': 0}
+
+def cache_get(cache, kind, key, versioned=False):
+    '''
+    Returns the cached answer (str) of key, or None on a miss. If versioned,
+    an answer tagged with another release than the release of the cache is a miss.
+    '''
+    with cache['lock']:
+        row = cache['connection'].execute('SELECT release, data, fetched FROM responses WHERE kind = ? AND key = ?',
+                                          (kind, key)).fetchone()
+        now = time.time()
+        if (row is None or (versioned and cache['release'] and row[0] != cache['release'])
+                or (cache['ttl'] and now - row[2] > cache['ttl'])):
+            cache['misses'] += 1
+            return None
+        cache['connection'].execute('UPDATE responses SET accessed = ? WHERE kind = ? AND key = ?', (now, kind, key))
+        cache['connection'].commit()
+        cache['hits'] += 1
+    return zlib.decompress(row[1]).decode()
+
+def cache_put(cache, kind, key, value, versioned=False):
+    '''
+    Stores the answer value (str) of key, tagged with the release of the cache if versioned.
+    '''
+    data = zlib.compress(value.encode())
+    now = time.time()
+    with cache['lock']:
+        cache['connection'].execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                    (kind, key, cache['release'] if versioned else None, data, len(data), now, now))
+        cache['connection'].commit()
+
+def evict_response_cache(cache, max_size_mb):
+    '''
+    Deletes the least recently used answers until the answers take at most
+    max_size_mb MB. Returns the number of answers deleted.
+    '''
+    max_size = max_size_mb * 1e6
+    with cache['lock']:
+        connection = cache['connection']
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= max_size:
+            return 0
+        evicted = []
+        for kind, key, size in connection.execute('SELECT kind, key, size FROM responses ORDER BY accessed'):
+            if total <= max_size:
+                break
+            evicted.append((kind, key))
+            total -= size
+        connection.executemany('DELETE FROM responses WHERE kind = ? AND key = ?', evicted)
+        connection.commit()
+    return len(evicted)
+
+def close_response_cache(cache):
+    '''
+    Applies the size limit of the cache (see evict_response_cache) and closes it.
+    '''
+    if cache['max_size']:
+        evict_response_cache(cache, cache['max_size'] / 1e6)
+    cache['connection'].close()
+
+def cache_summary(cache):
+    '''
+    Returns [(kind, release, number of answers, compressed size in MB)] of the cache.
+    '''
+    with cache['lock']:
+        rows = cache['connection'].execute('SELECT kind, release, COUNT(*), SUM(size) FROM responses GROUP BY kind, release ORDER BY kind, release').fetchall()
+    return [(kind, release, count, size / 1e6) for kind, release, count, size in rows]
+
+##################################################################################################################################################
+#
+# MAIN
+#
+##################################################################################################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Describes or trims the cache of OrthoDB and ENA answers written by fastas_recovery.py --cache.",
+        epilog="Exemple: python response_cache.py -c fastas_cache.sqlite --max_size 500")
+    parser.add_argument('-c','--cache', dest="cache", help="SQLite cache of fastas_recovery.py", required=True)
+    parser.add_argument('--max_size', type=float, help="evicts the least recently used answers down to this size (MB)")
+    args = parser.parse_args()
+
+    try:
+        cache = open_response_cache(args.cache)
+        if args.max_size is not None:
+            print(f"{evict_response_cache(cache, args.max_size)} answers evicted")
+        for kind, release, count, size in cache_summary(cache):
+            print(f"{kind}\t{release or '-'}\t{count} answers\t{size:.1f} MB")
+        close_response_cache(cache)
+    except Exception as e:
+        print(f"an error has occured : {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()